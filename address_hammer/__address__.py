@@ -1,4 +1,7 @@
 from __future__ import annotations
+from array import array
+from itertools import islice
+from operator import itemgetter
 from .__regex__ import normalize_whitespace
 from .__types__ import (
     Union,
@@ -57,6 +60,8 @@ def get(d: Dict[K, V], k: K, v: V) -> V:
 
 
 CHECKSUM_IGNORE = ""
+# a soft element that has more than one value in a group of addresses
+AMBIGUOUS = object()
 
 
 class Address(NamedTuple):
@@ -95,21 +100,24 @@ class Address(NamedTuple):
     batch_checksum: str = ""
 
     def __hash__(self) -> int:
-        return hash((self.hard_components(), self.soft_components()))
+        # the components are the first fields, so they are hashed as a single slice
+        return hash(self[:__n_components__])
 
     def __eq__(self, other: object) -> bool:
         if not isinstance(other, Address):
             raise NotImplementedError
-        if self.__class__ != other.__class__:
+        if self.__class__ is not other.__class__:
             # don't use isinstance because equality is not defined for Address, RawAddress
             return False
-        hards_match = self.hard_components() == other.hard_components()
-
-        if not hards_match:
+        n = __n_components__
+        if self[:n] == other[:n]:
+            # the common case (a lookup in a set or a dict) is that every component is the same
+            return True
+        if __hards_of__(self) != __hards_of__(other):
             return False
 
-        for s_soft, o_soft in zip(self.soft_components(), other.soft_components()):
-
+        for idx in __soft_idxs__:
+            s_soft, o_soft = self[idx], other[idx]
             if s_soft is not None and o_soft is not None:
                 if s_soft != o_soft:
                     return False
@@ -130,19 +138,15 @@ class Address(NamedTuple):
         if not isinstance(other, Address):
             raise NotImplementedError
         # TODO use soft components in __lt__ and __gt__
-        a = self.hard_components()  # , self.__str_softs__()
-        b = other.hard_components()  # , other.__str_softs__()
-        return a > b
+        return __hards_of__(self) > __hards_of__(other)
 
     def __lt__(self, other: object) -> bool:
         if not isinstance(other, Address):
             raise NotImplementedError
-        a = self.hard_components()  # , self.soft_components()
-        b = other.hard_components()  # , other.soft_components()
-        return a < b
+        return __hards_of__(self) < __hards_of__(other)
 
     def hard_components(self) -> Tuple[str, str, str, str]:
-        return (self.house_number, self.st_name, self.city, self.us_state)
+        return __hards_of__(self)
 
     def soft_components(self) -> Seq[Opt[str]]:
         return (self.st_suffix, self.st_NESW, self.unit, self.zip_code)
@@ -374,6 +378,15 @@ class Address(NamedTuple):
         return self._replace(orig=s)
 
 
+# the components are gathered by C code, with ``itemgetter`` (these are called many times for each address)
+__hards_of__: Fn[[Address], Tuple[str, str, str, str]] = itemgetter(
+    *[Address._fields.index(f) for f in HARD_COMPONENTS]
+)
+__soft_idxs__ = [Address._fields.index(f) for f in SOFT_COMPONENTS]
+__n_components__ = len(HARD_COMPONENTS) + len(SOFT_COMPONENTS)
+assert set(Address._fields[:__n_components__]) == set(HARD_COMPONENTS + SOFT_COMPONENTS)
+
+
 class RawAddress(Address):
     """
     A RawAddress is what is produced by a Parser.
@@ -384,127 +397,354 @@ class RawAddress(Address):
         raise NotImplementedError("RawAddress is not hashable")
 
 
-class HashableFactory(NamedTuple):
-    fill_in_info: Fn[[Address], List[Address]]
-    fix_by_hand: List[List[Address]]
+Hards = Tuple[str, str, str, str]
+Softs = Tuple[Opt[str], Opt[str], Opt[str]]
+
+
+class UnitIndex:
+    """
+    The (completed) units of a group of addresses, indexed by every pattern of their st_suffix, st_NESW and zip_code (each is either the value or ``None``, which matches anything).
+    ``index.compatible(a)`` is the units that are equal to an address 'a' without a unit, in the order of the group, with a single dict lookup:
+        ``[b for units in unit_store[hards].values() for b in units if a == b]``
+
+    After its typos are repaired, a unit either has each of these soft elements or none in its group has it (a unit that would be ambiguous is dropped),
+    so only the elements that the group has need to match.
+    """
+
+    __slots__ = ["has", "table", "scan"]
+    soft_idxs: List[int] = [Address._fields.index(f) for f in ["st_suffix", "st_NESW", "zip_code"]]
+    has: Tuple[bool, ...]
+    table: Dict[Softs, List[Address]]
+    scan: Opt[List[Address]]
+
+    def __init__(self, units: Dict[str, List[Address]]):
+        bs = list(join(units.values()))
+        self.has = tuple(any(b[idx] is not None for b in bs) for idx in self.soft_idxs)
+        table: Dict[Softs, List[Address]] = {}
+        self.table = table
+        kept = [idx for idx, has in zip(self.soft_idxs, self.has) if has]
+        if any(b[idx] is None for b in bs for idx in kept):
+            # only an empty string (which is specified, but isn't pooled with the soft elements of the group) gets here, and then the units are scanned
+            self.scan = bs
+            return None
+        self.scan = None
+        # the patterns of the keys, where the elements that nobody in the group has are always None
+        patterns = set(
+            tuple(has and bool(mask >> i & 1) for i, has in enumerate(self.has))
+            for mask in range(1 << len(self.has))
+        )
+        for b in bs:
+            vals = [b[idx] for idx in self.soft_idxs]
+            # the kept elements are never None, so each pattern is a different key
+            for pattern in patterns:
+                key: Any = tuple(v if keep else None for v, keep in zip(vals, pattern))
+                units_of = table.get(key)
+                if units_of is None:
+                    table[key] = [b]
+                else:
+                    units_of.append(b)
+
+    def compatible(self, a: Address) -> List[Address]:
+        if self.scan is not None:
+            return [b for b in self.scan if a == b]
+        key: Any = tuple(
+            a[idx] if has else None for idx, has in zip(self.soft_idxs, self.has)
+        )
+        return self.table.get(key, [])
+
+
+class HashableFactory:
+    """
+    Each address is mapped to a list of each with more complete (but incompatible) soft elements,
+    given all of the addresses the factory has seen (the soft elements of the addresses with the same hard elements are pooled together).
+
+    ``add`` updates a factory in place. It only has to redo the groups of addresses that share hard elements with the new ones, which it returns:
+        ``f = HashableFactory.from_all_addresses(addresses)``
+        ``touched = f.add(new_addresses)``
+
+    The units of each group are also indexed by their soft elements (see ``UnitIndex``), so completing an address without a unit never scans the units of its building
+    ``f.completed(addresses)`` completes addresses that were already added, resolving the soft elements of each group once (which is how a ``Hammer`` completes its batch)
+    """
+
+    soft_labels: List[str] = [label for label in SOFT_COMPONENTS if label != "unit"]
+    idx_of: Dict[str, int] = {field: idx for idx, field in enumerate(Address._fields)}
+    soft_idxs: List[Tuple[str, int]] = [
+        (label, Address._fields.index(label)) for label in soft_labels
+    ]
+
+    softs: Dict[Hards, Dict[str, Set[str]]]
+    groups: Dict[Hards, List[Address]]
+    raw_units: Dict[Hards, Dict[str, List[Address]]]
+    unit_store: Dict[Hards, Dict[str, List[Address]]]
+    #           dict[hards, dict[unit, addresses]]
+    unit_index: Dict[Hards, UnitIndex]
+
+    def __init__(self):
+        self.softs = {}
+        self.groups = {}
+        self.raw_units = {}
+        self.unit_store = {}
+        self.unit_index = {}
 
     def __call__(self, a: Address) -> List[Address]:
-        s = self.fill_in_info(a)
-        return s
+        adds = self.fill_in(a)
+        if adds is None:
+            return []
+        return adds
 
     def hashable_addresses(self, addresses: Iter[Address]) -> Iter[Address]:
         return join(map(lambda x: self(x), addresses))
 
-    @staticmethod
-    def from_all_addresses(addresses: Iter[Address]) -> HashableFactory:
-        """
-        Each address is mapped to a list of each with more complete (but incompatible) soft elements
-        """
-        addresses = list(addresses)
-
-        _SOFT_COMPONENTS = [label for label in SOFT_COMPONENTS if label != "unit"]
+    def fill_in(self, a: Address) -> Opt[List[Address]]:
+        hards = a.hard_components()
+        d_softs: Dict[str, Set[str]] = self.softs[hards]
+
+        filled: List[Opt[str]] = []
+        for label, idx in self.soft_idxs:
+            vals = d_softs[label]
+            val = a[idx]
+            if val:  # it is specified in 'a'
+                vals.add(val)
+                filled.append(val)
+            elif len(vals) > 1:  # it's ambigous and not specified in 'a'
+                return None
+            elif val is None and vals:
+                # it's not specified in 'a', but there's only 1 option it could be
+                filled.append(next(iter(vals)))
+            else:
+                filled.append(val)
+        return self.__units_of__(a, hards, self.__make__(a, filled))
+
+    def __units_of__(self, a: Address, hards: Hards, filled: Address) -> List[Address]:
+        "The completions of 'a', given the address 'filled' that has the soft elements of its group"
+        # this is where filling units shoud be toggled
+        ret: List[Address] = []
+
+        if a.unit:
+            return [filled]
+        index = self.unit_index.get(hards)
+        if index is None:
+            return [filled]
+        if a.__class__ is not Address or a.unit is not None:
+            # the units are never equal to 'a' (see ``Address.__eq__``)
+            return ret
+        for b in index.compatible(a):
+            # the same as ``a.combine_soft(b)``, without checking (again) that they are equal
+            ret.append(
+                Address(
+                    house_number=a.house_number,
+                    st_name=a.st_name,
+                    st_suffix=opt_sum(a.st_suffix, b.st_suffix),
+                    st_NESW=opt_sum(a.st_NESW, b.st_NESW),
+                    unit=b.unit,
+                    city=a.city,
+                    us_state=a.us_state,
+                    zip_code=opt_sum(a.zip_code, b.zip_code),
+                    orig=a.orig,
+                    batch_checksum=a.batch_checksum,
+                )
+            )
+        return ret
 
-        def new_dict() -> Dict[str, Set[str]]:
-            return {soft: set([]) for soft in _SOFT_COMPONENTS}
+    @staticmethod
+    def __make__(a: Address, filled: List[Opt[str]]) -> Address:
+        "'a' with the soft elements 'filled' (in the order of ``soft_labels``)"
+        st_suffix, st_NESW, zip_code = filled
+        return Address(
+            house_number=a.house_number,
+            st_name=a.st_name,
+            st_suffix=st_suffix,
+            st_NESW=st_NESW,
+            unit=a.unit,
+            city=a.city,
+            us_state=a.us_state,
+            zip_code=zip_code,
+            orig=a.orig,
+            batch_checksum=a.batch_checksum,
+        )
 
-        d: Dict[Seq[str], Dict[str, Set[str]]] = {}
+    def __resolve__(self, hards: Hards) -> List[Any]:
+        "The value that each soft element of the group takes when an address doesn't specify it: the only one, ``None`` or ``AMBIGUOUS``"
+        resolved: List[Any] = []
+        for label in self.soft_labels:
+            vals = self.softs[hards][label]
+            if len(vals) > 1:
+                resolved.append(AMBIGUOUS)
+            elif vals:
+                resolved.append(next(iter(vals)))
+            else:
+                resolved.append(None)
+        return resolved
+
+    def __fill__(self, a: Address, resolved: List[Any]) -> Opt[Address]:
+        "``fill_in`` of the soft elements of 'a' (a member of its group), given the ``__resolve__`` of its group. ``None`` if it's ambiguous"
+        filled: List[Opt[str]] = []
+        for (_, idx), r in zip(self.soft_idxs, resolved):
+            val = a[idx]
+            if val:
+                filled.append(val)
+            elif r is AMBIGUOUS:
+                return None
+            else:
+                filled.append(r if val is None else val)
+        return self.__make__(a, filled)
 
-        unit_store: Dict[Tuple[str, str, str, str], Dict[str, List[Address]]] = {}
-        #             dict[hards, dict[unit, addresses]]
+    def completed(self, addresses: Iter[Address]) -> Iter[Address]:
+        """
+        ``join(map(f, addresses))`` for addresses that were already added to the factory (so they can't change it),
+        which resolves the soft elements of each group once instead of once per address
+        """
+        resolved: Dict[Hards, List[Any]] = {}
         for a in addresses:
             hards = a.hard_components()
-            softs = d.get(hards, new_dict())
-            a_dict = a._asdict()
-            # softs["st_NESW"] = set(["E", "W"])
-            # print("SOFTS", softs)
-            for k, v in a_dict.items():
-                # print(k in softs, k, a.pretty())
-                if k in softs and v:  # softs[k]:
-
-                    softs[k].add(v)
-            d[hards] = softs
+            r = resolved.get(hards)
+            if r is None:
+                r = self.__resolve__(hards)
+                resolved[hards] = r
+            filled = self.__fill__(a, r)
+            if filled is not None:
+                yield from self.__units_of__(a, hards, filled)
+
+    def add(self, addresses: Iter[Address]) -> Set[Hards]:
+        "Adds 'addresses' in place and returns the hard elements of each group of addresses that might now be completed differently"
+        touched: Dict[Hards, None] = {}
+        soft_idxs = self.soft_idxs
+        for a in addresses:
+            hards = a.hard_components()
+            softs = self.softs.get(hards)
+            if softs is None:
+                softs = {soft: set([]) for soft in self.soft_labels}
+                self.softs[hards] = softs
+                self.groups[hards] = []
+            for label, idx in soft_idxs:
+                v = a[idx]
+                if v:
+                    softs[label].add(v)
+            self.groups[hards].append(a)
+            touched[hards] = None
 
             if a.unit:
-                u_adds: Dict[str, List[Address]] = unit_store.get(hards, {})
+                u_adds: Dict[str, List[Address]] = self.raw_units.get(hards, {})
                 adds = u_adds.get(a.unit, [])
                 adds.append(a)
                 u_adds[a.unit] = adds
-                unit_store[hards] = u_adds
-
-        # should go in Address class?
-        idx_of: Dict[str, int] = {
-            field: int for int, field in enumerate(Address._fields)
-        }
-
-        def fill_in(a: Address) -> Opt[List[Address]]:
-            hards = a.hard_components()
-            d_softs: Dict[str, Set[str]] = d[hards]
-
-            a_dict: Dict[str, Opt[str]] = {label: None for label in _SOFT_COMPONENTS}
-
-            for label in _SOFT_COMPONENTS:
-                vals = d_softs.get(label, set([]))
-                val = a[idx_of[label]]
-                if val:  # it is specified in 'a'
-                    vals.add(val)
-                    a_dict[label] = val
-                elif (
-                    len(vals) == 1
-                ):  # it's not specified in 'a', but there's only 1 option it could be
-                    a_dict[label] = list(vals)[0]
-                elif len(vals) > 1:  # it's ambigous and not specified in 'a'
-                    return None
-
-            # this is where filling units shoud be toggled
-            ret: List[Address] = []
-
-            if a.unit:
-                return [a.combine_soft_dict(a_dict).__as_address__()]
-            empty_d: Dict[str, List[Address]] = {}
-            units: Dict[str, List[Address]] = unit_store.get(hards, empty_d)
-            if not units:
-                return [a.combine_soft_dict(a_dict).__as_address__()]
-            for adds in units.values():
-                ret.extend([a.combine_soft(b).__as_address__() for b in adds if a == b])
-            return ret
+                self.raw_units[hards] = u_adds
 
         # remove ambigous apt addresses
-        for hards, u_adds in unit_store.items():
-            for unit, adds in u_adds.items():
-                unit_store[hards][unit] = list(join(filter(None, map(fill_in, adds))))
-
-        def is_ambig(softs: Dict[str, Set[str]]) -> bool:
-            """
-            Is there more that one value for any given soft component? (except unit)
-            ...
-            The (less readable) definition was the following:
-            --l = [list(filter(None, v)) for k, v in softs.items() if k != "unit"]
-            --m = max(map(len, l))
-            --return m > 1
-            """
-            for label, vals in softs.items():
-                n_vals: int = len(list(filter(None, vals)))
-                if label != "unit" and n_vals > 1:
-                    return True
-            return False
+        for hards in touched:
+            u_adds = self.raw_units.get(hards, {})
+            if u_adds:
+                r = self.__resolve__(hards)
+                self.unit_store[hards] = {
+                    unit: [b for b in (self.__fill__(a, r) for a in adds) if b is not None]
+                    for unit, adds in u_adds.items()
+                }
+                self.unit_index[hards] = UnitIndex(self.unit_store[hards])
+        return set(touched)
 
-        fix_by_hand: Dict[Tuple[str, str, str, str], List[Address]] = {}
+    @staticmethod
+    def is_ambig(softs: Dict[str, Set[str]]) -> bool:
+        """
+        Is there more that one value for any given soft component? (except unit)
+        ...
+        The (less readable) definition was the following:
+        --l = [list(filter(None, v)) for k, v in softs.items() if k != "unit"]
+        --m = max(map(len, l))
+        --return m > 1
+        """
+        for label, vals in softs.items():
+            n_vals: int = len(list(filter(None, vals)))
+            if label != "unit" and n_vals > 1:
+                return True
+        return False
+
+    @property
+    def fix_by_hand(self) -> List[List[Address]]:
+        "The groups of addresses that cannot have mismatching st_suffix, st_NESW or zip_code, but do"
+        return [
+            list(group)
+            for hards, group in self.groups.items()
+            if self.is_ambig(self.softs[hards])
+        ]
+
+    def snapshot(self) -> Dict[str, Any]:
+        """
+        The tables of the factory as plain data (for ``Hammer.save``): the addresses of the groups and then of the units, as an ``AddressList``,
+        and the shape of the tables as arrays of counts and codes into its strings (``raw_units`` is left out, it's rebuilt from the groups)
+        """
+        from .__store__ import AddressList
+
+        adds = AddressList()
+        group_of: Dict[Hards, int] = {}
+        group_sizes, soft_sizes, soft_codes = array("I"), array("I"), array("I")
+        for hards, group in self.groups.items():
+            group_of[hards] = len(group_of)
+            group_sizes.append(len(group))
+            adds.extend(group)
+            softs = self.softs[hards]
+            for label in self.soft_labels:
+                soft_sizes.append(len(softs[label]))
+                soft_codes.extend(map(adds.intern, softs[label]))
+        unit_groups, unit_counts = array("I"), array("I")
+        unit_codes, unit_sizes = array("I"), array("I")
+        for hards, units in self.unit_store.items():
+            unit_groups.append(group_of[hards])
+            unit_counts.append(len(units))
+            for unit, bs in units.items():
+                unit_codes.append(adds.intern(unit))
+                unit_sizes.append(len(bs))
+                adds.extend(bs)
+        return {
+            "addresses": adds.snapshot(),
+            "group_sizes": group_sizes,
+            "soft_sizes": soft_sizes,
+            "soft_codes": soft_codes,
+            "unit_groups": unit_groups,
+            "unit_counts": unit_counts,
+            "unit_codes": unit_codes,
+            "unit_sizes": unit_sizes,
+        }
 
-        for a in addresses:
-            hards = a.hard_components()
-            softs = d[hards]
-            if is_ambig(softs):  # cannot have mismatching st_suffix,st_NESW or zip_code
-                similar_addresses = fix_by_hand.get(hards, [])
-                similar_addresses.append(a)
-                fix_by_hand[hards] = similar_addresses
-
-        def fix(a: Address) -> List[Address]:
-            adds = fill_in(a)
-            if adds is None:
-                return []
-            return adds
-
-        return HashableFactory(fill_in_info=fix, fix_by_hand=list(fix_by_hand.values()))
+    @staticmethod
+    def from_snapshot(d: Dict[str, Any]) -> HashableFactory:
+        from .__store__ import AddressList
+
+        f = HashableFactory()
+        # the soft elements and units are never None
+        strings: List[Any] = d["addresses"]["strings"]
+        adds = iter(AddressList.from_snapshot(d["addresses"]))
+        soft_sizes, soft_codes = iter(d["soft_sizes"]), iter(d["soft_codes"])
+        hards_of: List[Hards] = []
+        for size in d["group_sizes"]:
+            group = list(islice(adds, size))
+            hards = group[0].hard_components()
+            hards_of.append(hards)
+            f.groups[hards] = group
+            softs: Dict[str, Set[str]] = {}
+            for label in f.soft_labels:
+                n = next(soft_sizes)
+                softs[label] = set(strings[c] for c in islice(soft_codes, n))
+            f.softs[hards] = softs
+            for a in group:
+                if a.unit:
+                    f.raw_units.setdefault(hards, {}).setdefault(a.unit, []).append(a)
+        unit_codes, unit_sizes = iter(d["unit_codes"]), iter(d["unit_sizes"])
+        for g, n in zip(d["unit_groups"], d["unit_counts"]):
+            units: Dict[str, List[Address]] = {}
+            for _ in range(n):
+                units[strings[next(unit_codes)]] = list(islice(adds, next(unit_sizes)))
+            f.unit_store[hards_of[g]] = units
+            f.unit_index[hards_of[g]] = UnitIndex(units)
+        return f
+
+    @staticmethod
+    def from_all_addresses(addresses: Iter[Address]) -> HashableFactory:
+        """
+        Each address is mapped to a list of each with more complete (but incompatible) soft elements
+        """
+        f = HashableFactory()
+        f.add(addresses)
+        return f
 
 
 def merge_duplicates(addresses: Iter[Address]) -> Set[Address]:
@@ -0,0 +1,104 @@
+"""
+The ``batch_checksum`` of a ``Hammer``, which ties each completed address to the batch (and the settings) it was completed with.
+
+There are two modes:
+    * ``"md5"`` (the default) hashes the addresses in sorted order, so it needs the whole batch and a sort
+    * ``"unordered"`` adds up a digest of each address (see ``BatchChecksum``), which streams in O(n) and doesn't depend on the order of the batch
+
+The two modes never give the same checksum for a batch.
+"""
+from __future__ import annotations
+from hashlib import blake2b, md5
+from .__types__ import Iter, Seq
+from .__address__ import Address
+
+MD5 = "md5"
+UNORDERED = "unordered"
+CHECKSUM_MODES = (MD5, UNORDERED)
+
+# the digests of the addresses are added up modulo 2 ** (8 * DIGEST_SIZE)
+DIGEST_SIZE = 16
+__modulus__ = 1 << (8 * DIGEST_SIZE)
+__separator__ = "\x1f"
+__none__ = "\x1e"
+
+
+def md5_checksum(settings: Iter[str], addresses: Seq[Address]) -> str:
+    "The checksum of the md5 mode: the settings, then the components of each address in sorted order"
+    m = md5()
+    for s in settings:
+        m.update(s.encode("utf-8"))
+    # the same order as 'sorted(addresses)', but each key is only built once
+    for a in sorted(addresses, key=Address.hard_components):
+        for s in a.hard_components():
+            m.update(s.encode("utf-8"))
+        for _s in a.soft_components():
+            if _s:
+                m.update(_s.encode("utf-8"))
+    return m.hexdigest()
+
+
+class BatchChecksum:
+    """
+    The checksum of the ``"unordered"`` mode: the sum (modulo 2**128) of a digest of the components of each address, and how many there are.
+    Addition is commutative, so the checksum is the same for any order of the batch, and it can be built a shard at a time and updated later:
+
+        ``c = BatchChecksum(settings, shard_1)``
+        ``c.update(shard_2)``
+        ``assert c.hexdigest() == (BatchChecksum(settings, shard_2) + BatchChecksum(settings, shard_1)).hexdigest()``
+
+    Checksums can only be added if they have the same settings.
+    """
+
+    __slots__ = ["settings", "total", "n"]
+    settings: bytes
+    total: int
+    n: int
+
+    def __init__(self, settings: Iter[str] = (), addresses: Iter[Address] = ()):
+        m = blake2b(digest_size=DIGEST_SIZE)
+        for s in settings:
+            m.update(s.encode("utf-8"))
+            m.update(__separator__.encode("utf-8"))
+        self.settings = m.digest()
+        self.total = 0
+        self.n = 0
+        self.update(addresses)
+
+    @staticmethod
+    def digest_of(a: Address) -> int:
+        "The digest of the hard and soft components of 'a' (a missing soft component differs from any string)"
+        components = (*a.hard_components(), *a.soft_components())
+        s = __separator__.join([__none__ if c is None else c for c in components])
+        return int.from_bytes(
+            blake2b(s.encode("utf-8"), digest_size=DIGEST_SIZE).digest(), "little"
+        )
+
+    def update(self, addresses: Iter[Address]) -> None:
+        # ``digest_of``, inlined (this is the whole cost of the checksum)
+        sep, none, from_bytes = __separator__, __none__, int.from_bytes
+        total = self.total
+        n = 0
+        for a in addresses:
+            components = (*a.hard_components(), *a.soft_components())
+            s = sep.join([none if c is None else c for c in components])
+            digest = blake2b(s.encode("utf-8"), digest_size=DIGEST_SIZE).digest()
+            total += from_bytes(digest, "little")
+            n += 1
+        self.total = total % __modulus__
+        self.n += n
+
+    def __add__(self, other: BatchChecksum) -> BatchChecksum:
+        if self.settings != other.settings:
+            raise ValueError("cannot add the checksums of batches with different settings")
+        c: BatchChecksum = BatchChecksum.__new__(BatchChecksum)
+        c.settings = self.settings
+        c.total = (self.total + other.total) % __modulus__
+        c.n = self.n + other.n
+        return c
+
+    def hexdigest(self) -> str:
+        m = blake2b(self.settings, digest_size=DIGEST_SIZE)
+        m.update(self.total.to_bytes(DIGEST_SIZE, "little"))
+        m.update(self.n.to_bytes(8, "little"))
+        return m.hexdigest()
@@ -1,26 +1,42 @@
 from __future__ import annotations
-from math import sqrt, nan
+from math import sqrt, nan, ceil
 import re
-from .__types__ import Dict, Iter, Tuple, Fn, T, Set, Any, join, Fns_Of
+from sys import intern
+from array import array
+from collections import OrderedDict
+from .__types__ import Dict, Iter, Tuple, T, Set, Any, List, Opt, NamedTuple
 
-Bow = Dict[str, float]
+try:
+    import numpy as np
+except ImportError:  # numpy is optional, it's only used by ``FixTypos.fix_many``
+    np = None
 
+Bow = Dict[int, float]
 
-def skipgram(text: str) -> Iter[Tuple[str, float]]:
-    length = len(text)
-    for i in range(length):
-        for j in range(i, length):
-            if i != j:
-                yield text[i] + "_" + text[
-                    j
-                ], 1.0  # / float((j - i))# float(2**(j - i))
-                # yield text[i] + "_" + text[j], 1.0 / float(1.5**(j - i))
+
+def pack_skipgram(a: str, b: str) -> int:
+    "The skipgram 'a_b' as an int, which is cheaper to build, hash and store than a string (21 bits hold any code point)"
+    return (ord(a) << 21) | ord(b)
+
+
+def skipgram(text: str) -> Iter[Tuple[int, float]]:
+    "Each ordered pair of characters of 'text' (see ``pack_skipgram``)"
+    codes = [ord(c) for c in text]
+    for i, a in enumerate(codes):
+        high = a << 21
+        for b in codes[i + 1 :]:
+            yield high | b, 1.0  # / float((j - i))# float(2**(j - i))
 
 
 def skipgram_bow(s: str) -> Bow:
     d: Bow = {}
-    for tg, weight in skipgram(s):
-        d[tg] = d.get(tg, 0) + weight
+    get = d.get
+    codes = [ord(c) for c in s]
+    for i, a in enumerate(codes):
+        high = a << 21
+        for b in codes[i + 1 :]:
+            tg = high | b
+            d[tg] = get(tg, 0.0) + 1.0
     return d
 
 
@@ -63,14 +79,241 @@ def const_false(_: Any) -> bool:
     return False
 
 
-class Fns_of_FixTypos(Fns_Of):
+uppers = re.compile(r"[A-Z]")
+digits = re.compile(r"\d+")
+
+
+def trigrams(s: str) -> Set[str]:
+    "The character trigrams of 's' padded with '^' and '$', which are far more selective than skipgrams for finding candidates"
+    padded = "^" + s + "$"
+    return set(padded[i : i + 3] for i in range(len(padded) - 2))
+
+
+class VocabIndex:
+    """
+    The vocabulary of ``FixTypos``, with an inverted index (postings lists) from trigrams to words that generates the candidates to score.
+
+    Almost every word shares some skipgram with any other word, so scoring every word that shares a skipgram is a full scan.
+    Instead, ``candidates`` only looks at words that
+        * share at least one of the query's trigrams. When 'min_sim' is at least ``prune_above``, the ``min_shared`` fraction of its most common trigrams (by document frequency, like IDF) aren't scanned either
+        * pass a length filter: the weighted Jaccard similarity of two bows is at most ``min(|a|, |b|) / max(|a|, |b|)``, so this one never drops a word that could reach 'min_sim'
+
+    NOTE: this is lossy, since the candidates come from trigrams but the similarity is over skipgrams: a word can reach 'min_sim' without sharing a trigram that was scanned (or any trigram at all).
+    A typo of an edit or two shares most of the trigrams of its word, so up to the default level the repairs are almost always the same as scoring every word, but at the loosest levels a few words that were close enough are never scored.
+    Below ``prune_above`` (levels 6 and up) a match often shares only common trigrams, so they are all scanned
+    """
+
+    min_shared: float = 0.25
+    prune_above: float = 0.5
+    words: List[str]
+    id_of: Dict[str, int]
+    starts: array
+    features: array
+    counts: array
+    sizes: array
+    digits: List[Tuple[str, ...]]
+    postings: Dict[str, List[int]]
+    __matrix__: Opt[BowMatrix]
+
+    def __init__(self, words: Iter[str] = ()):
+        self.__matrix__ = None
+        self.words = []
+        self.id_of = {}
+        self.starts = array("q", [0])
+        self.features = array("q")
+        self.counts = array("d")
+        self.sizes = array("d")
+        self.digits = []
+        self.postings = {}
+        for word in words:
+            self.add(word)
+
+    def add(self, word: str) -> None:
+        if word in self.id_of:
+            return None
+        word = intern(word)
+        idx = len(self.words)
+        bow = skipgram_bow(word)
+        self.words.append(word)
+        self.id_of[word] = idx
+        self.features.extend(bow.keys())
+        self.counts.extend(bow.values())
+        self.starts.append(len(self.features))
+        self.sizes.append(sum(bow.values()))
+        self.digits.append(tuple(digits.findall(word)))
+        for tg in trigrams(word):
+            posting = self.postings.get(tg)
+            if posting is None:
+                self.postings[tg] = [idx]
+            else:
+                posting.append(idx)
+        return None
+
+    def __contains__(self, word: str) -> bool:
+        return word in self.id_of
+
+    def __len__(self) -> int:
+        return len(self.words)
+
+    def rare_trigrams(self, s: str, min_sim: float) -> List[str]:
+        "The trigrams of 's' whose postings are scanned for candidates with a similarity of at least 'min_sim', rarest first"
+        postings = self.postings
+        tgs = sorted(trigrams(s), key=lambda tg: len(postings.get(tg, ())))
+        if min_sim < self.prune_above:
+            return tgs
+        n_rare = len(tgs) - max(1, ceil(len(tgs) * self.min_shared)) + 1
+        return tgs[:n_rare]
+
     @staticmethod
-    def sims_of(s: str) -> Iter[Tuple[str, float]]:
-        return []
+    def size_bounds(size: float, min_sim: float) -> Tuple[float, float]:
+        "The sizes of the bows that could have a similarity of 'min_sim' with a bow of size 'size' (a little wider, so that rounding can't drop a word)"
+        return size * min_sim * (1 - 1e-9), size / max(min_sim, 1e-9) * (1 + 1e-9)
+
+    def candidates(self, s: str, bow: Bow, min_sim: float) -> List[int]:
+        "The ids (in order) of the plausible words for 's' (whose skipgrams are 'bow') to have a weighted Jaccard similarity of at least 'min_sim'"
+        size = sum(bow.values())
+        if size == 0:
+            return []
+        found: Set[int] = set([])
+        for tg in self.rare_trigrams(s, min_sim):
+            found.update(self.postings.get(tg, ()))
+        sizes = self.sizes
+        lo, hi = self.size_bounds(size, min_sim)
+        return sorted(idx for idx in found if lo <= sizes[idx] <= hi)
+
+    def bow(self, idx: int) -> Bow:
+        lo, hi = self.starts[idx], self.starts[idx + 1]
+        return dict(zip(self.features[lo:hi], self.counts[lo:hi]))
+
+    def similarity(self, idx: int, bow: Bow, size: float) -> float:
+        "``weighted_jaccard(self.bow(idx), bow)``, straight from the arrays ('size' is the sum of 'bow')"
+        lo, hi = self.starts[idx], self.starts[idx + 1]
+        get = bow.get
+        n = 0.0
+        for feature, count in zip(self.features[lo:hi], self.counts[lo:hi]):
+            other = get(feature)
+            if other is not None:
+                n += count if count < other else other
+        d = size + self.sizes[idx] - n
+        if d == 0:
+            return nan
+        return n / d
+
+    def snapshot(self) -> Dict[str, Any]:
+        "The index as plain data (for ``Hammer.save``)"
+        return {
+            "words": self.words,
+            "starts": self.starts,
+            "features": self.features,
+            "counts": self.counts,
+            "sizes": self.sizes,
+            "digits": self.digits,
+            "postings": self.postings,
+        }
 
     @staticmethod
-    def should_maybe_fix(s: str) -> bool:
-        return False
+    def from_snapshot(d: Dict[str, Any]) -> VocabIndex:
+        index = VocabIndex()
+        index.words = [intern(w) for w in d["words"]]
+        index.id_of = {word: idx for idx, word in enumerate(index.words)}
+        index.starts = d["starts"]
+        index.features = d["features"]
+        index.counts = d["counts"]
+        index.sizes = d["sizes"]
+        index.digits = d["digits"]
+        index.postings = d["postings"]
+        return index
+
+    def matrix(self) -> "BowMatrix":
+        "The vocabulary as a ``BowMatrix``, which is built (with numpy) on first use"
+        if self.__matrix__ is None or self.__matrix__.n_rows != len(self.words):
+            self.__matrix__ = BowMatrix(self)
+        return self.__matrix__
+
+
+class BowMatrix:
+    """
+    The bows of a ``VocabIndex`` as a CSR sparse matrix (the arrays of the index, copied into numpy), along with its postings.
+    ``weighted_jaccard`` scores many (query, word) pairs at once: the sum of the mins is gathered from the CSR rows of the words
+    and the dense rows of the queries, and the sum of the maxes is ``|query| + |word| - sum of mins``.
+    """
+
+    n_rows: int
+    indptr: Any
+    indices: Any
+    data: Any
+    sizes: Any
+    digit_key: Any
+    digit_key_of: Dict[Tuple[str, ...], int]
+    postings: Dict[str, Any]
+
+    def __init__(self, index: VocabIndex):
+        self.n_rows = len(index.words)
+        # copies, since the arrays of the index can't grow while numpy holds their buffers
+        self.indptr = np.frombuffer(index.starts, dtype=np.int64).copy()
+        self.indices = np.frombuffer(index.features, dtype=np.int64).copy()
+        self.data = np.frombuffer(index.counts, dtype=np.float64).copy()
+        self.sizes = np.frombuffer(index.sizes, dtype=np.float64).copy()
+        self.digit_key_of = {}
+        self.digit_key = np.array(
+            [self.digit_key_of.setdefault(d, len(self.digit_key_of)) for d in index.digits],
+            dtype=np.int64,
+        )
+        self.postings = {
+            tg: np.array(ids, dtype=np.int64) for tg, ids in index.postings.items()
+        }
+
+    def weighted_jaccard(self, bows: List[Bow], pairs_q: Any, pairs_w: Any) -> Any:
+        "The weighted Jaccard similarity of each pair of (``bows[pairs_q[i]]``, word ``pairs_w[i]``)"
+        # the queries are a dense matrix over only their own features, the others map to a column of zeros
+        features = np.unique(
+            np.fromiter((f for bow in bows for f in bow), dtype=np.int64)
+        )
+        q = np.zeros((len(bows), len(features) + 1), dtype=np.float64)
+        for row, bow in enumerate(bows):
+            q[row, np.searchsorted(features, list(bow))] = list(bow.values())
+        q_sizes = q.sum(axis=1)
+
+        starts = self.indptr[pairs_w]
+        lens = self.indptr[pairs_w + 1] - starts
+        pair_of = np.repeat(np.arange(len(pairs_w)), lens)
+        pos = np.arange(lens.sum()) + np.repeat(starts - (np.cumsum(lens) - lens), lens)
+        word_features = self.indices[pos]
+        cols = np.searchsorted(features, word_features)
+        cols[cols == len(features)] = 0
+        cols[features[cols] != word_features] = len(features)
+        mins = np.minimum(self.data[pos], q[pairs_q[pair_of], cols])
+        n = np.bincount(pair_of, weights=mins, minlength=len(pairs_w))
+        d = q_sizes[pairs_q] + self.sizes[pairs_w] - n
+        return n / d
+
+    def candidates(self, index: VocabIndex, s: str, size: float, min_sim: float) -> Any:
+        "The same as ``VocabIndex.candidates`` (plus the digits filter of ``FixTypos.sims_of``), but as a numpy array"
+        s_key = self.digit_key_of.get(tuple(digits.findall(s)))
+        arrays = [
+            self.postings[tg]
+            for tg in index.rare_trigrams(s, min_sim)
+            if tg in self.postings
+        ]
+        if size == 0 or s_key is None or not arrays:
+            return np.zeros(0, dtype=np.int64)
+        ids = np.unique(np.concatenate(arrays))
+        lo, hi = index.size_bounds(size, min_sim)
+        sizes = self.sizes[ids]
+        return ids[(lo <= sizes) & (sizes <= hi) & (self.digit_key[ids] == s_key)]
+
+
+class CacheInfo(NamedTuple):
+    "The stats of the cache of a ``FixTypos`` (or a ``Parser``), like ``functools.lru_cache`` reports them"
+    hits: int
+    misses: int
+    maxsize: int
+    currsize: int
+
+    @property
+    def hit_ratio(self) -> float:
+        total = self.hits + self.misses
+        return self.hits / total if total else 0.0
 
 
 class FixTypos:
@@ -82,80 +325,172 @@ class FixTypos:
         ``a = FixTypos(vocablist, cuttoff = 1 )``
         ``b = FixTypos(vocablist, cuttoff = 10)``
         ``c = FixTypos(vocablist, cuttoff = 0 )``
+
+    The repair of each word (even if it's left as is) is remembered in a bounded LRU cache of 'cache_size' words (0 turns it off).
+    The hits and misses are in ``fix_typos.cache_info()``
     """
 
     cuttoff: float
-    __fns__: Fns_of_FixTypos
-
-    @property
-    def sims_of(self) -> Fn[[str], Iter[Tuple[str, float]]]:
-        return self.__fns__.sims_of
-
-    @property
-    def should_maybe_fix(self) -> Fn[[str], bool]:
-        return self.__fns__.should_maybe_fix
+    index: Opt[VocabIndex]
+    cache_size: int
+    hits: int
+    misses: int
+    __cache__: OrderedDict[str, str]
 
-    def __init__(self, words: Iter[str], cuttoff: float = 5):
-        self.__fns__ = Fns_of_FixTypos()
+    def __init__(self, words: Iter[str], cuttoff: float = 5, cache_size: int = 4096):
+        if cache_size < 0:
+            raise ValueError(f"cache_size must be at least 0, not {cache_size}")
+        self.cache_size = cache_size
+        self.hits = 0
+        self.misses = 0
+        self.__cache__ = OrderedDict()
         if cuttoff == 0.0:
+            self.cuttoff = 1.0
+            self.index = None
             return None
         self.cuttoff = level_to_dec(cuttoff)
+        self.index = VocabIndex(words)
 
-        words = list(words)
-        words_with: Dict[str, Set[str]] = {}
-        # swm = SubWordModel.new(words, get_features=weighted_skipgram)
-        # vec_of = {}
-        bow_of: Dict[str, Bow] = {}
-        # TODO base of frequency and don't recalculate seen words
-        # z = np.zeros(swm.n)
-        for word in join([words, ["QWERTYUIOPASDFGHJKLZXCVBNM "]]):
-            tri_bow = skipgram_bow(word)
-            # vec_of[word] = swm.word2row(word)
-            bow_of[word] = skipgram_bow(word)
-            for tri in tri_bow:
-                words_with[tri] = words_with.get(tri, set([]))
-                words_with[tri].add(word)
-        uppers = re.compile(r"[A-Z]")
-        digits = re.compile(r"\d+")
-
-        class __Fns_of_FixTypos__(Fns_of_FixTypos):
-            @staticmethod
-            def should_maybe_fix(s: str) -> bool:
-                s_uppers = re.findall(uppers, s)
-                if len("".join(s_uppers)) < 4:
-                    return False
-                if s in bow_of:
-                    return False
-                return True
-
-            @staticmethod
-            def sims_of(s: str) -> Iter[Tuple[str, float]]:
-                words: Set[str] = set([])
-                bow = skipgram_bow(s)
-                # s_vec = swm.word2row(s)
-                s_bow = skipgram_bow(s)
-                s_digits = re.findall(digits, s)
-                for tri in bow:
-                    words.update(words_with.get(tri, []))
-                return map(
-                    lambda w: (w, weighted_jaccard(bow_of[w], s_bow)),
-                    filter(
-                        lambda w: w != s and s_digits == re.findall(digits, w), words
-                    ),
-                )
-
-        self.__fns__ = __Fns_of_FixTypos__()
+    def should_maybe_fix(self, s: str) -> bool:
+        if self.index is None:
+            return False
+        if len(uppers.findall(s)) < 4:
+            return False
+        if s in self.index:
+            return False
+        return True
 
-    def __call__(self, s: str) -> str:
+    def sims_of(self, s: str) -> Iter[Tuple[str, float]]:
+        """
+        The similarity of 's' to each word of the vocabulary that could be close enough to replace it.
+        Words that can't reach the cuttoff are never scored
+        """
+        index = self.index
+        if index is None:
+            return []
+        s_bow = skipgram_bow(s)
+        s_size = sum(s_bow.values())
+        s_digits = tuple(digits.findall(s))
+        words = index.words
+        return [
+            (words[idx], index.similarity(idx, s_bow, s_size))
+            for idx in index.candidates(s, s_bow, self.cuttoff ** 2)
+            if index.digits[idx] == s_digits and words[idx] != s
+        ]
+
+    def add(self, words: Iter[str]) -> None:
+        "Adds 'words' to the vocabulary, and forgets the cached repairs if it grew (since they might have changed). The hits and misses are kept"
+        if self.index is None:
+            return None
+        n = len(self.index)
+        for word in words:
+            self.index.add(word)
+        if len(self.index) != n:
+            self.__cache__.clear()
+        return None
+
+    def snapshot(self) -> Dict[str, Any]:
+        "The vocabulary and settings as plain data (for ``Hammer.save``), the cache is left out"
+        index = None if self.index is None else self.index.snapshot()
+        return {"cuttoff": self.cuttoff, "cache_size": self.cache_size, "index": index}
+
+    @staticmethod
+    def from_snapshot(d: Dict[str, Any]) -> FixTypos:
+        fix_typos = FixTypos([], cuttoff=0.0, cache_size=d["cache_size"])
+        fix_typos.cuttoff = d["cuttoff"]
+        if d["index"] is not None:
+            fix_typos.index = VocabIndex.from_snapshot(d["index"])
+        return fix_typos
+
+    def cache_info(self) -> CacheInfo:
+        return CacheInfo(self.hits, self.misses, self.cache_size, len(self.__cache__))
 
-        s = s.upper()
-        if self.should_maybe_fix(s):
-            try:
-                word, similarity = max(self.sims_of(s), key=lambda x: x[1])
-            except ValueError:  # self.sims_of(s) was empty
-                return s
-            similarity = sqrt(similarity)
-            # print(s, word, similarity)
-            if similarity > self.cuttoff:
-                return word
+    def cache_clear(self) -> None:
+        "Forgets the cached repairs and resets the stats"
+        self.__cache__.clear()
+        self.hits = 0
+        self.misses = 0
+
+    def __cached__(self, s: str) -> Opt[str]:
+        fixed = self.__cache__.get(s)
+        if fixed is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+            self.__cache__.move_to_end(s)
+        return fixed
+
+    def __remember__(self, s: str, fixed: str) -> None:
+        if self.cache_size:
+            self.__cache__[s] = fixed
+            if len(self.__cache__) > self.cache_size:
+                self.__cache__.popitem(last=False)
+
+    def __repair__(self, s: str) -> str:
+        try:
+            word, similarity = max(self.sims_of(s), key=lambda x: x[1])
+        except ValueError:  # self.sims_of(s) was empty
+            return s
+        similarity = sqrt(similarity)
+        # print(s, word, similarity)
+        if similarity > self.cuttoff:
+            return word
         return s
+
+    def fix_many(self, words: Iter[str], chunk_size: int = 512) -> List[str]:
+        """
+        The same as ``[fix_typos(w) for w in words]``, but repeated words are only fixed once and all candidates are scored at once with numpy.
+        Without numpy, it falls back to calling ``fix_typos`` on each distinct word
+        """
+        words = [intern(w.upper()) for w in words]
+        index = self.index
+        fixed: Dict[str, str] = {}
+        todo: List[str] = []
+        for w in dict.fromkeys(w for w in words if self.should_maybe_fix(w)):
+            f = self.__cached__(w)
+            if f is None:
+                todo.append(w)
+            else:
+                fixed[w] = f
+        if np is None or index is None:
+            for w in todo:
+                fixed[w] = self.__repair__(w)
+                self.__remember__(w, fixed[w])
+            return [fixed.get(w, w) for w in words]
+
+        m = index.matrix()
+        min_sim = self.cuttoff ** 2
+        for start in range(0, len(todo), chunk_size):
+            chunk = todo[start : start + chunk_size]
+            bows = [skipgram_bow(s) for s in chunk]
+            ids = [
+                m.candidates(index, s, sum(bow.values()), min_sim)
+                for s, bow in zip(chunk, bows)
+            ]
+            lens = np.array([len(i) for i in ids], dtype=np.int64)
+            sims = np.zeros(0)
+            if lens.sum():
+                pairs_q = np.repeat(np.arange(len(chunk)), lens)
+                pairs_w = np.concatenate(ids)
+                sims = m.weighted_jaccard(bows, pairs_q, pairs_w)
+            ends = np.cumsum(lens)
+            for s, end, n in zip(chunk, ends, lens):
+                fixed[s] = s
+                if n:
+                    # the first best candidate, like ``max`` in ``__repair__``
+                    best = end - n + int(np.argmax(sims[end - n : end]))
+                    if sqrt(sims[best]) > self.cuttoff:
+                        fixed[s] = index.words[pairs_w[best]]
+                self.__remember__(s, fixed[s])
+        return [fixed.get(w, w) for w in words]
+
+    def __call__(self, s: str) -> str:
+        # the words are interned like the parsed components, so a repaired address shares their string objects
+        s = intern(s.upper())
+        if not self.should_maybe_fix(s):
+            return s
+        fixed = self.__cached__(s)
+        if fixed is None:
+            fixed = self.__repair__(s)
+            self.__remember__(s, fixed)
+        return fixed
@@ -0,0 +1,222 @@
+"""
+A compact, memory-mappable on-disk format for the compiled city gazetteer.
+
+Importing ``__data__`` means evaluating a ~470KB python literal, and then the city trie has to be compiled from it.
+A gazetteer file holds the already compiled trie, so a short-lived process can mmap it and start matching right away:
+
+    ``python -m address_hammer.__gazetteer__ [path]``
+
+writes the file (by default next to this module, where ``base_city_trie`` looks for it).
+Using a gazetteer file is optional. If it's missing, stale or unreadable, the cities are compiled from ``__data__`` as usual.
+
+The layout is a header followed by native-endian uint32 arrays (the byte order is in the header):
+    * ``offsets``     n_strings + 1  -- the sorted string table (tokens and labels) is ``strings[offsets[i]:offsets[i+1]]``
+    * ``labels``      n_states       -- string id of the label of each state, or ``NO_LABEL``
+    * ``edge_starts`` n_states + 1   -- the edges of state ``s`` are ``edge_starts[s]:edge_starts[s+1]``
+    * ``edge_tokens`` n_edges        -- string id of the token of each edge, sorted within each state
+    * ``edge_targets`` n_edges       -- the state each edge leads to
+    * ``strings``                    -- the utf-8 string table
+"""
+from __future__ import annotations
+import os
+import sys
+import mmap
+import struct
+from array import array
+from bisect import bisect_left
+from hashlib import md5
+from .__types__ import Dict, List, Tuple, Seq, Opt, Fn
+from .__zipper__ import GenericInput as In
+from .__trie__ import TokenTrie
+
+MAGIC = b"AHGZ"
+# 2: the labels have their whitespace normalized (see ``city_rows``)
+VERSION = 2
+NO_LABEL = 0xFFFFFFFF
+
+# magic, version, byteorder, data digest, n_strings, n_states, n_edges
+__header__ = struct.Struct("<4sII16sIII")
+
+__here__ = os.path.dirname(os.path.abspath(__file__))
+DEFAULT_PATH = os.path.join(__here__, "gazetteer.bin")
+DATA_PATH = os.path.join(__here__, "__data__.py")
+
+__byteorder__ = {"little": 0, "big": 1}[sys.byteorder]
+
+
+class GazetteerError(Exception):
+    "Raised when a gazetteer file can't be used (missing, stale or from another version)"
+    pass
+
+
+def data_digest() -> bytes:
+    "The digest of ``__data__.py``, so that a gazetteer file is never used after the data it was built from changes"
+    with open(DATA_PATH, "rb") as f:
+        return md5(f.read()).digest()
+
+
+def write_gazetteer(trie: TokenTrie, path: str = DEFAULT_PATH) -> None:
+    strings = sorted(
+        set(token for edges in trie.edges for token in edges).union(
+            l for l in trie.labels if l is not None
+        )
+    )
+    id_of: Dict[str, int] = {s: idx for idx, s in enumerate(strings)}
+
+    encoded = [s.encode("utf-8") for s in strings]
+    offsets = array("I", [0])
+    for b in encoded:
+        offsets.append(offsets[-1] + len(b))
+
+    labels = array("I", (NO_LABEL if l is None else id_of[l] for l in trie.labels))
+    edge_starts = array("I", [0])
+    edge_tokens = array("I")
+    edge_targets = array("I")
+    for edges in trie.edges:
+        for token_id, target in sorted((id_of[t], s) for t, s in edges.items()):
+            edge_tokens.append(token_id)
+            edge_targets.append(target)
+        edge_starts.append(len(edge_tokens))
+
+    header = __header__.pack(
+        MAGIC,
+        VERSION,
+        __byteorder__,
+        data_digest(),
+        len(strings),
+        len(labels),
+        len(edge_tokens),
+    )
+    tmp = path + ".tmp"
+    with open(tmp, "wb") as f:
+        f.write(header)
+        for arr in [offsets, labels, edge_starts, edge_tokens, edge_targets]:
+            arr.tofile(f)
+        f.write(b"".join(encoded))
+    os.replace(tmp, path)
+
+
+class MappedTrie:
+    """
+    A read-only ``TokenTrie`` backed by a memory-mapped gazetteer file.
+    Nothing is decoded up front except the token -> id dict, states and edges are read straight from the map.
+    """
+
+    __slots__ = [
+        "__mmap__",
+        "offsets",
+        "labels",
+        "edge_starts",
+        "edge_tokens",
+        "edge_targets",
+        "strings",
+        "id_of",
+    ]
+    offsets: memoryview
+    labels: memoryview
+    edge_starts: memoryview
+    edge_tokens: memoryview
+    edge_targets: memoryview
+    strings: memoryview
+    id_of: Dict[str, int]
+
+    def __init__(self, path: str = DEFAULT_PATH):
+        try:
+            with open(path, "rb") as f:
+                m = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        except (OSError, ValueError) as e:
+            raise GazetteerError(f"cannot map '{path}': {e}")
+        if len(m) < __header__.size:
+            raise GazetteerError(f"'{path}' is truncated")
+        header = __header__.unpack_from(m)
+        magic, version, byteorder, digest, n_strings, n_states, n_edges = header
+        if magic != MAGIC or version != VERSION or byteorder != __byteorder__:
+            raise GazetteerError(f"'{path}' is not a version {VERSION} gazetteer")
+        if digest != data_digest():
+            raise GazetteerError(f"'{path}' is stale, rebuild it from __data__")
+
+        view = memoryview(m)
+        pos = __header__.size
+
+        def take(n: int) -> memoryview:
+            nonlocal pos
+            v = view[pos : pos + 4 * n].cast("I")
+            pos += 4 * n
+            return v
+
+        self.__mmap__ = m
+        self.offsets = take(n_strings + 1)
+        self.labels = take(n_states)
+        self.edge_starts = take(n_states + 1)
+        self.edge_tokens = take(n_edges)
+        self.edge_targets = take(n_edges)
+        self.strings = view[pos:]
+        if len(self.strings) != self.offsets[n_strings]:
+            raise GazetteerError(f"'{path}' is truncated")
+        words = bytes(self.strings).decode("utf-8")
+        offsets = self.offsets
+        # the string table is ascii in practice, but fall back to decoding each string if it isn't
+        if len(words) == len(self.strings):
+            self.id_of = {
+                words[offsets[i] : offsets[i + 1]]: i for i in range(n_strings)
+            }
+        else:
+            self.id_of = {self.string(i): i for i in range(n_strings)}
+
+    def string(self, idx: int) -> str:
+        b = self.strings[self.offsets[idx] : self.offsets[idx + 1]]
+        return bytes(b).decode("utf-8")
+
+    def longest_match(
+        self, data: Seq[str], start: int = 0, end: Opt[int] = None
+    ) -> Tuple[Opt[str], int]:
+        id_of, labels = self.id_of, self.labels
+        edge_starts, edge_tokens, edge_targets = (
+            self.edge_starts,
+            self.edge_tokens,
+            self.edge_targets,
+        )
+        state = 0
+        label_id = NO_LABEL
+        match_end = start
+        for idx in range(start, len(data) if end is None else end):
+            token_id = id_of.get(data[idx])
+            if token_id is None:
+                break
+            lo, hi = edge_starts[state], edge_starts[state + 1]
+            e = bisect_left(edge_tokens, token_id, lo, hi)
+            if e == hi or edge_tokens[e] != token_id:
+                break
+            state = edge_targets[e]
+            if labels[state] != NO_LABEL:
+                label_id, match_end = labels[state], idx + 1
+        if label_id == NO_LABEL:
+            return None, start
+        return self.string(label_id), match_end
+
+    def __call__(self, inpt: In[str], save: Fn[[In[str]], None]) -> Opt[str]:
+        label, match_end = self.longest_match(inpt.data, inpt.state, inpt.end)
+        if label is None:
+            return None
+        save(inpt.advance(match_end - inpt.state))
+        return label
+
+    def __len__(self) -> int:
+        return len(self.labels)
+
+
+def gazetteer_path() -> str:
+    "``$ADDRESS_HAMMER_GAZETTEER`` if it's set, otherwise the default path next to this module"
+    return os.environ.get("ADDRESS_HAMMER_GAZETTEER", DEFAULT_PATH)
+
+
+def main(argv: List[str]) -> None:
+    from .__parsing__ import compile_base_city_trie
+
+    path = argv[1] if len(argv) > 1 else gazetteer_path()
+    write_gazetteer(compile_base_city_trie(), path)
+    print(f"wrote {path} ({os.path.getsize(path)} bytes)")
+
+
+if __name__ == "__main__":
+    main(sys.argv)
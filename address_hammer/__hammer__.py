@@ -1,11 +1,39 @@
 from __future__ import annotations
+import gc
+import io
+import os
+import pickle
+import struct
 import warnings
+import zlib
 from math import log as math_log
-from hashlib import md5
-from .__types__ import Union, T, Fn, Seq, List, Tuple, Dict, Set, join, Iter
+from .__types__ import (
+    Union,
+    T,
+    Fn,
+    Seq,
+    List,
+    Tuple,
+    Dict,
+    Set,
+    join,
+    Iter,
+    Opt,
+    NamedTuple,
+    Any,
+)
 from .__address__ import Address, HashableFactory, CHECKSUM_IGNORE
 from .__fuzzy_string__ import FixTypos
-from .__parsing__ import Parser, ParseError, smart_batch
+from .__store__ import AddressStore, ColumnTable
+from .__checksum__ import BatchChecksum, CHECKSUM_MODES, MD5, md5_checksum
+from concurrent.futures import Executor
+from .__parsing__ import (
+    Parser,
+    ParseError,
+    ParseFailure,
+    smart_batch,
+    parallel_batch,
+)
 
 Bag = Dict[str, int]
 
@@ -40,6 +68,47 @@ def check_checksum(a: str, b: str):
 
 remove_unit = Address.Set(unit=lambda x: None)
 
+SNAPSHOT_MAGIC = b"AHSN"
+SNAPSHOT_VERSION = 3
+
+# magic, version, length of the compressed payload
+__snapshot_header__ = struct.Struct("<4sIQ")
+
+
+class SnapshotError(Exception):
+    "Raised when a file can't be loaded as a ``Hammer`` (not a snapshot, from another version or corrupt)"
+    pass
+
+
+class SnapshotUnpickler(pickle.Unpickler):
+    """
+    The payload of a snapshot is only builtins (dicts, lists, sets, strings and numbers) and the ``array`` columns of the address tables,
+    so this refuses every other global, which is what makes loading a pickle from somewhere else run arbitrary code
+    """
+
+    allowed: Set[Tuple[str, str]] = {
+        ("array", "array"),
+        ("array", "_array_reconstructor"),
+    }
+
+    def find_class(self, module: str, name: str) -> Any:
+        if (module, name) not in self.allowed:
+            raise pickle.UnpicklingError(
+                f"'{module}.{name}' is not allowed in a snapshot"
+            )
+        return super().find_class(module, name)
+
+
+class HammerUpdate(NamedTuple):
+    """
+    What ``Hammer.add`` changed:
+        * ``added`` are the completed addresses that the hammer didn't have before
+        * ``changed`` maps each completed address that the hammer no longer has to what it is now completed as (nothing if it became ambiguous)
+    """
+
+    added: List[Address]
+    changed: Dict[Address, List[Address]]
+
 
 class Hammer:
     """
@@ -65,6 +134,36 @@ class Hammer:
 
         ``hammer["123 Main Apt 7 Boston MA"] == "123 W Main St Apt 7 Boston MA"``
 
+    Parsing the address strings is the slowest part of building a ``Hammer``. It can be spread across processes with ``workers`` (or an ``executor`` of your own). The result is the same as a serial build:
+
+        ``hammer = Hammer(all_addresses, workers=8)``
+
+    New addresses can be added later, without re-parsing the ones that the hammer has already seen:
+
+        ``update = hammer.add(todays_addresses)``
+
+    A built hammer can be saved, and loading it is much faster than building it again:
+
+        ``hammer.save("hammer.snapshot")``
+
+        ``hammer = Hammer.load("hammer.snapshot")``
+
+    The completed addresses are kept in a columnar ``AddressStore``. With ``keep_orig=False`` neither it nor the groups of ``hammer.ambigous_address_groups`` keep their ``orig`` strings (they are ``""``),
+    which saves a lot of memory (and snapshot size) on big batches:
+
+        ``hammer = Hammer(all_addresses, keep_orig=False)``
+
+    The ``batch_checksum`` sorts the whole batch by default. With ``checksum_mode="unordered"`` it's a ``BatchChecksum`` instead,
+    which is computed in a single pass and doesn't depend on the order of the batch:
+
+        ``hammer = Hammer(all_addresses, checksum_mode="unordered")``
+
+    They can be exported all at once as columns, and a batch of address strings can be mapped to their rows in that table (to join on integers instead of addresses):
+
+        ``table = hammer.export()``
+
+        ``rows = hammer.lookup_many(strings)``
+
     """
 
     p: Parser
@@ -72,8 +171,12 @@ class Hammer:
     __repair_city__: FixTypos
     parse_errors: List[Tuple[ParseError, str]]
     ambigous_address_groups: List[List[Address]]
-    __addresses__: Set[Address]
+    __addresses__: AddressStore
     __hashable_factory__: HashableFactory
+    __junk_cities__: Set[str]
+    __junk_streets__: Set[str]
+    __city_bag__: Bag
+    __st_name_bag__: Bag
     batch_checksum: str
 
     def __init__(
@@ -86,6 +189,10 @@ class Hammer:
         junk_cities: Seq[str] = (),
         junk_streets: Seq[str] = (),
         make_batch_checksum: bool = True,
+        checksum_mode: str = MD5,
+        workers: int = 1,
+        executor: Opt[Executor] = None,
+        keep_orig: bool = True,
     ):
 
         if city_repair_level > 10 or city_repair_level < 0:
@@ -98,44 +205,32 @@ class Hammer:
                 f"The typo repair level must be between 0-10, not {street_repair_level}"
             )
 
-        p = Parser(known_cities=list(known_cities))
-        address_strings: List[str] = []
-        adds: List[Address] = []
-        parse_errors: List[Tuple[ParseError, str]] = []
-        for address in input_addresses:
-            if isinstance(address, str):
-                address_strings.append(address)
-            else:
-                adds.append(address)
+        if workers < 1:
+            raise ValueError(f"The number of workers must be at least 1, not {workers}")
 
-        def addresses_iter() -> Iter[Address]:
-            junk_cities_set = set(junk_cities)
-            junk_streets_set = set(junk_streets)
-
-            # ok:Fn[[Address], bool] = lambda a: a.city not in junk_cities_set \
-            #                                   and a.st_name not in junk_streets_set
-            def ok(a: Address) -> bool:
-                if a.city in junk_cities_set:
-                    parse_errors.append((ParseError(a.orig, "junk city"), a.orig))
-                    return False
-                if a.st_name in junk_streets_set:
-                    parse_errors.append((ParseError(a.orig, "junk street"), a.orig))
-                    return False
-                return True
-
-            report_error: Fn[
-                [ParseError, str], None
-            ] = lambda e, s: parse_errors.append((e, s))
-            yield from filter(
-                ok, smart_batch(p, address_strings, report_error=report_error)
+        if checksum_mode not in CHECKSUM_MODES:
+            raise ValueError(
+                f"The checksum mode must be one of {CHECKSUM_MODES}, not '{checksum_mode}'"
             )
-            yield from filter(ok, adds)
 
-        addresses = list(addresses_iter())
+        self.__junk_cities__ = set(junk_cities)
+        self.__junk_streets__ = set(junk_streets)
+        parse_errors: List[Tuple[ParseError, str]] = []
+        p = Parser(known_cities=list(known_cities))
+        addresses = self.__parse__(
+            p,
+            input_addresses,
+            parse_errors,
+            workers,
+            executor,
+        )
 
         cuttoff = math_log(max(len(addresses), 1))
 
         city_bag = bag_from(map(Address.Get.city, addresses))
+        st_name_bag = bag_from(map(Address.Get.st_name, addresses))
+        self.__city_bag__ = city_bag
+        self.__st_name_bag__ = st_name_bag
 
         if city_repair_level == 0:
             self.__repair_city__ = FixTypos([], cuttoff=0.0)
@@ -150,7 +245,6 @@ class Hammer:
         if street_repair_level == 0:
             self.__repair_st__ = FixTypos([], cuttoff=0.0)
         else:
-            st_name_bag = bag_from(map(Address.Get.st_name, addresses))
             streets = [
                 *known_streets,
                 *filter(lambda s: cuttoff < st_name_bag.get(s, 0), st_name_bag.keys()),
@@ -158,51 +252,253 @@ class Hammer:
 
             self.__repair_st__ = FixTypos(streets, cuttoff=street_repair_level)
 
-        # MD5 SUM
+        settings = join([junk_cities, junk_streets, known_cities, known_streets])
         if not make_batch_checksum:
             checksum = ""
+        elif checksum_mode == MD5:
+            checksum = md5_checksum(settings, addresses)
         else:
-
-            m = md5()
-
-            to_hash_str = [junk_cities, junk_streets, known_cities, known_streets]
-
-            for s in join(to_hash_str):
-                m.update(s.encode("utf-8"))
-            # print(len(list(filter(None, addresses))))
-            # print(list(map(Address.Get.pretty, addresses)))
-            # addresses = sorted(filter(None, addresses))
-            for a in sorted(addresses):
-                for s in a.hard_components():
-                    m.update(s.encode("utf-8"))
-                for _s in a.soft_components():
-                    if _s:
-                        m.update(_s.encode("utf-8"))
-
-            checksum = m.hexdigest()
+            checksum = BatchChecksum(settings, addresses).hexdigest()
         self.batch_checksum = checksum
         self.fix_typos = Address.Set(
             city=self.__repair_city__,
             st_name=self.__repair_st__,
             batch_checksum=lambda _: checksum,
         )
-        addresses = [self.fix_typos(a) for a in addresses]
-        self.p = Parser(known_cities=list(city_bag.keys()))
+        # the typos of the whole batch are repaired at once, which is much faster than calling ``self.fix_typos`` on each address
+        cities = self.__repair_city__.fix_many([a.city for a in addresses])
+        st_names = self.__repair_st__.fix_many([a.st_name for a in addresses])
+        # the factory keeps these for the life of the hammer, so without 'keep_orig' they don't keep their orig either
+        addresses = [
+            a._replace(
+                city=city,
+                st_name=st_name,
+                batch_checksum=checksum,
+                orig=a.orig if keep_orig else "",
+            )
+            for a, city, st_name in zip(addresses, cities, st_names)
+        ]
+        p.add_known_cities(city_bag.keys())
+        self.p = p
         self.__hashable_factory__ = HashableFactory.from_all_addresses(addresses)
         self.ambigous_address_groups = self.__hashable_factory__.fix_by_hand
-        self.__addresses__ = set(join(map(self.zero_or_more, addresses)))
+        # the addresses were just added to the factory and all have the batch's checksum, so they can be completed group by group
+        self.__addresses__ = AddressStore(
+            self.__hashable_factory__.completed(addresses), keep_orig=keep_orig
+        )
         self.parse_errors = parse_errors
 
         # self.__hashable_factory__.fix_by_hand
 
+    def __parse__(
+        self,
+        p: Parser,
+        input_addresses: Iter[Union[str, Address]],
+        parse_errors: List[Tuple[ParseError, str]],
+        workers: int = 1,
+        executor: Opt[Executor] = None,
+    ) -> List[Address]:
+        "Parses the strings of 'input_addresses' and drops the addresses with a junk city or street"
+        address_strings: List[str] = []
+        adds: List[Address] = []
+        for address in input_addresses:
+            if isinstance(address, str):
+                address_strings.append(address)
+            else:
+                adds.append(address)
+
+        junk_cities_set = self.__junk_cities__
+        junk_streets_set = self.__junk_streets__
+
+        # ok:Fn[[Address], bool] = lambda a: a.city not in junk_cities_set \
+        #                                   and a.st_name not in junk_streets_set
+        def ok(a: Address) -> bool:
+            if a.city in junk_cities_set:
+                parse_errors.append((ParseError(a.orig, "junk city"), a.orig))
+                return False
+            if a.st_name in junk_streets_set:
+                parse_errors.append((ParseError(a.orig, "junk street"), a.orig))
+                return False
+            return True
+
+        report_error: Fn[
+            [ParseError, str], None
+        ] = lambda e, s: parse_errors.append((e, s))
+        if workers > 1 or executor is not None:
+            batch = parallel_batch(
+                p,
+                address_strings,
+                report_error=report_error,
+                workers=workers,
+                executor=executor,
+            )
+        else:
+            batch = smart_batch(p, address_strings, report_error=report_error)
+        return [*filter(ok, batch), *filter(ok, adds)]
+
+    def add(
+        self,
+        input_addresses: Iter[Union[str, Address]],
+        workers: int = 1,
+        executor: Opt[Executor] = None,
+    ) -> HammerUpdate:
+        """
+        Adds new addresses in place, as if they had been in the batch the hammer was built with.
+        Only the new addresses are parsed, and only the groups of addresses that share hard components with them are completed again.
+
+        NOTE: It's cheaper than a rebuild, but not quite the same
+            * the ``batch_checksum`` stays the one of the batch the hammer was built with, so addresses from before the update can still be used
+            * cities and streets that are now frequent enough are added to the typo vocabularies, but nothing is ever dropped from them, and addresses from before the update are not repaired again
+
+        The parse errors are added to ``hammer.parse_errors``
+        """
+        if workers < 1:
+            raise ValueError(f"The number of workers must be at least 1, not {workers}")
+        addresses = self.__parse__(
+            self.p, input_addresses, self.parse_errors, workers, executor
+        )
+
+        city_bag, st_name_bag = self.__city_bag__, self.__st_name_bag__
+        for a in addresses:
+            city_bag[a.city] = city_bag.get(a.city, 0) + 1
+            st_name_bag[a.st_name] = st_name_bag.get(a.st_name, 0) + 1
+        # a word that wasn't frequent enough before and isn't in this batch can't be frequent enough now
+        cuttoff = math_log(max(sum(city_bag.values()), 1))
+        self.__repair_city__.add(
+            c for c in set(map(Address.Get.city, addresses)) if cuttoff < city_bag[c]
+        )
+        self.__repair_st__.add(
+            s
+            for s in set(map(Address.Get.st_name, addresses))
+            if cuttoff < st_name_bag[s]
+        )
+
+        checksum = self.batch_checksum
+        cities = self.__repair_city__.fix_many([a.city for a in addresses])
+        st_names = self.__repair_st__.fix_many([a.st_name for a in addresses])
+        keep_orig = self.__addresses__.keep_orig
+        addresses = [
+            a._replace(
+                city=city,
+                st_name=st_name,
+                batch_checksum=checksum,
+                orig=a.orig if keep_orig else "",
+            )
+            for a, city, st_name in zip(addresses, cities, st_names)
+        ]
+
+        f = self.__hashable_factory__
+        hards = set(a.hard_components() for a in addresses)
+        before = set(f.completed(a for h in hards for a in f.groups.get(h, ())))
+        after = set(f.completed(a for h in f.add(addresses) for a in f.groups[h]))
+        removed = before - after
+        added = [a for a in after if a not in self.__addresses__]
+        self.__addresses__.difference_update(removed)
+        self.__addresses__.update(added)
+
+        self.p.add_known_cities(city_bag.keys())
+        self.ambigous_address_groups = f.fix_by_hand
+        return HammerUpdate(added=added, changed={a: f(a) for a in removed})
+
+    def save(self, path: str) -> None:
+        """
+        Writes the hammer to 'path': a small header and then a zlib-compressed pickle of plain data (no parsers, functions or ``Address`` objects),
+        where the addresses are columns of codes into string tables (see ``AddressStore.snapshot`` and ``HashableFactory.snapshot``). ``Hammer.load`` reads it back
+        """
+        data: Dict[str, Any] = {
+            "batch_checksum": self.batch_checksum,
+            "parse_errors": [(e.orig, e.reason, s) for e, s in self.parse_errors],
+            "addresses": self.__addresses__.snapshot(),
+            "hashable_factory": self.__hashable_factory__.snapshot(),
+            "repair_city": self.__repair_city__.snapshot(),
+            "repair_st": self.__repair_st__.snapshot(),
+            "junk_cities": self.__junk_cities__,
+            "junk_streets": self.__junk_streets__,
+            "city_bag": self.__city_bag__,
+            "st_name_bag": self.__st_name_bag__,
+            "known_cities": self.p.known_cities,
+        }
+        payload = zlib.compress(pickle.dumps(data, protocol=pickle.HIGHEST_PROTOCOL))
+        tmp = path + ".tmp"
+        with open(tmp, "wb") as f:
+            f.write(
+                __snapshot_header__.pack(SNAPSHOT_MAGIC, SNAPSHOT_VERSION, len(payload))
+            )
+            f.write(payload)
+        os.replace(tmp, path)
+
+    @staticmethod
+    def load(path: str) -> Hammer:
+        "Reads a hammer that was written by ``hammer.save``. The payload may only hold plain data and arrays (see ``SnapshotUnpickler``), anything else is a ``SnapshotError``"
+        with open(path, "rb") as f:
+            header = f.read(__snapshot_header__.size)
+            if len(header) < __snapshot_header__.size:
+                raise SnapshotError(f"'{path}' is not a Hammer snapshot")
+            magic, version, length = __snapshot_header__.unpack(header)
+            if magic != SNAPSHOT_MAGIC:
+                raise SnapshotError(f"'{path}' is not a Hammer snapshot")
+            if version != SNAPSHOT_VERSION:
+                raise SnapshotError(
+                    f"'{path}' is a version {version} snapshot, not version {SNAPSHOT_VERSION}"
+                )
+            payload = f.read()
+        if len(payload) != length:
+            raise SnapshotError(f"'{path}' is truncated")
+        # unpickling and rebuilding the tables make many small containers, which would set off the cyclic gc over and over
+        gc_was_enabled = gc.isenabled()
+        gc.disable()
+        try:
+            try:
+                raw = io.BytesIO(zlib.decompress(payload))
+                data: Dict[str, Any] = SnapshotUnpickler(raw).load()
+            except (zlib.error, pickle.UnpicklingError, EOFError) as e:
+                raise SnapshotError(f"'{path}' is corrupt: {e}")
+            return Hammer.__from_snapshot__(data)
+        finally:
+            if gc_was_enabled:
+                gc.enable()
+
+    @staticmethod
+    def __from_snapshot__(data: Dict[str, Any]) -> Hammer:
+        h: Hammer = Hammer.__new__(Hammer)
+        checksum: str = data["batch_checksum"]
+        h.batch_checksum = checksum
+        h.parse_errors = [
+            (ParseError(orig, reason), s) for orig, reason, s in data["parse_errors"]
+        ]
+        h.__addresses__ = AddressStore.from_snapshot(data["addresses"])
+        h.__hashable_factory__ = HashableFactory.from_snapshot(data["hashable_factory"])
+        h.ambigous_address_groups = h.__hashable_factory__.fix_by_hand
+        h.__repair_city__ = FixTypos.from_snapshot(data["repair_city"])
+        h.__repair_st__ = FixTypos.from_snapshot(data["repair_st"])
+        h.__junk_cities__ = data["junk_cities"]
+        h.__junk_streets__ = data["junk_streets"]
+        h.__city_bag__ = data["city_bag"]
+        h.__st_name_bag__ = data["st_name_bag"]
+        h.p = Parser(known_cities=data["known_cities"])
+        h.fix_typos = Address.Set(
+            city=h.__repair_city__,
+            st_name=h.__repair_st__,
+            batch_checksum=lambda _: checksum,
+        )
+        return h
+
     def map(self, f: Fn[[Address], Address]) -> Hammer:
         h = Hammer([])
         h.batch_checksum = self.batch_checksum
         h.parse_errors = self.parse_errors
         h.p = self.p
         h.ambigous_address_groups = self.ambigous_address_groups
-        h.__addresses__ = set(map(f, self.__addresses__))
+        h.__addresses__ = AddressStore(
+            map(f, self.__addresses__.to_list()), keep_orig=self.__addresses__.keep_orig
+        )
         h.__hashable_factory__ = self.__hashable_factory__
+        h.__repair_city__ = self.__repair_city__
+        h.__repair_st__ = self.__repair_st__
+        h.__junk_cities__ = self.__junk_cities__
+        h.__junk_streets__ = self.__junk_streets__
+        h.__city_bag__ = self.__city_bag__
+        h.__st_name_bag__ = self.__st_name_bag__
         return h
 
     def __getitem__(self, a: Union[Address, str]) -> Address:
@@ -211,8 +507,10 @@ class Hammer:
             check_checksum(self.batch_checksum, a.batch_checksum)
         if isinstance(a, str):
             a = self.p(a)
-        a = self.fix_typos(a)
+        return self.__unique__(self.fix_typos(a))
 
+    def __unique__(self, a: Address) -> Address:
+        "The lookup of ``hammer[a]``, after 'a' is parsed and its typos are repaired"
         adds = self.__hashable_factory__(a)
         if len(adds) == 0:
             # return None
@@ -229,14 +527,58 @@ class Hammer:
         warnings.warn(msg)
         return remove_unit(adds[0])
 
+    def __get_many__(self, adds: Seq[str]) -> List[Union[Address, Exception]]:
+        """
+        ``hammer[a]`` for each address string of 'adds', or the exception it raises.
+        The strings are parsed together with ``Parser.parse_many`` and their typos are repaired together with ``FixTypos.fix_many``
+        """
+        parsed = list(self.p.parse_many(adds))
+        ok = [a for a in parsed if not isinstance(a, ParseFailure)]
+        cities = self.__repair_city__.fix_many([a.city for a in ok])
+        st_names = self.__repair_st__.fix_many([a.st_name for a in ok])
+        checksum = self.batch_checksum
+        fixed = iter(
+            [
+                a._replace(city=city, st_name=st_name, batch_checksum=checksum)
+                for a, city, st_name in zip(ok, cities, st_names)
+            ]
+        )
+        out: List[Union[Address, Exception]] = []
+        for a in parsed:
+            if isinstance(a, ParseFailure):
+                out.append(a.as_error())
+                continue
+            try:
+                out.append(self.__unique__(next(fixed)))
+            except KeyError as e:
+                out.append(e)
+        return out
+
     def __len__(self) -> int:
         return len(self.__addresses__)
 
     def __iter__(self) -> Iter[Address]:
+        "NOTE: each ``Address`` is built from the columns of the store as it's read (about 10x slower than iterating a set of them), so ``as_list`` is faster for all of them"
         return iter(self.__addresses__)
 
     def as_list(self) -> List[Address]:
-        return list(self.__addresses__)
+        return self.__addresses__.to_list()
+
+    def export(self) -> ColumnTable:
+        "The completed addresses as columns (see ``ColumnTable``), in the order of ``as_list()``"
+        return self.__addresses__.table()
+
+    def lookup_many(self, adds: Seq[str]) -> Any:
+        """
+        The row in ``export()`` of ``hammer[s]`` for each string of 'adds', as an int64 numpy array (or ``array("q")`` without numpy).
+        The row is -1 where ``hammer[s]`` raises an error, and where the address it returns isn't in the table
+        (such as an address without a unit that matches several units of its building, which is returned without a unit).
+        The rows are those of the table until the hammer is updated with ``add``
+        """
+        found = self.__get_many__(adds)
+        return self.__addresses__.positions(
+            None if isinstance(a, Exception) else a for a in found
+        )
 
     def zero_or_more(self, a: Union[Address, str]) -> List[Address]:
         if isinstance(a, Address):
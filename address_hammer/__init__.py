@@ -2,6 +2,8 @@ from .__address__ import Address, RawAddress, InvalidAddressError
 from .__parsing__ import Parser, ParseError
 from .__hammer__ import Hammer
 from .__sheet__ import Sheet
+from .__serve__ import Service, LocalClient, ServiceMetrics
+from .__checksum__ import BatchChecksum
 
 """
 p = Parser(known_cities="Houston Dallas".split())
@@ -31,4 +33,8 @@ __all__ = [
     "RawAddress",
     "InvalidAddressError",
     "Hammer",
+    "Service",
+    "LocalClient",
+    "ServiceMetrics",
+    "BatchChecksum",
 ]
@@ -1,13 +1,25 @@
 from __future__ import annotations
-from typing import Pattern, NamedTuple, Type, Mapping
+from typing import Pattern, Match, NamedTuple, Type, Mapping, FrozenSet, TYPE_CHECKING
 from .__types__ import *
 from .__zipper__ import GenericInput as In
 from .__zipper__ import EndOfInputError
+from .__trie__ import TokenTrie, LayeredTrie
 from .__regex__ import or_ as regex_or
 from .__regex__ import normalize_whitespace
-from .__data__ import state_city_pairs, default_cities
 from .__address__ import RawAddress
+from .__fuzzy_string__ import CacheInfo
+from functools import lru_cache
+from collections import OrderedDict
+from concurrent.futures import Executor, ProcessPoolExecutor
+import os
 import re
+import json
+import tempfile
+import warnings
+from sys import intern
+
+if TYPE_CHECKING:
+    from .__gazetteer__ import MappedTrie
 
 
 class ParseError(Exception):
@@ -39,12 +51,10 @@ st_suffices = [s for s in st_suffices if s not in state_set]
 unit_types_set = set(unit_types_lst)
 
 st_NESWs: List[str] = ["NE", "NW", "SE", "SW", "N", "S", "E", "W"]
-st_NESW_R = re.compile(regex_or(st_NESWs))
 
 
 us_state_R = re.compile(regex_or(us_states))
 
-unit_R = re.compile(regex_or(unit_types_lst))
 unit_identifier_R = re.compile(r"\#?\s*((\d+[A-Z]?|[A-Z]\d*)|([A-Z]|\d+)-([A-Z]|\d+))")
 # unit_identifier_R = re.compile(r"([A-Z]|\d+)-([A-Z]|\d+)")
 
@@ -64,17 +74,68 @@ def dicts_to_pattern(*ds: Dict[str, List[Union[str, List[str]]]]) -> Pattern[str
     return re.compile(regex_or(set(f)))
 
 
-st_suffix_R = dicts_to_pattern(st_suffix_syns)
+class TokenMatcher:
+    """
+    Whole-token membership in a vocabulary, which is what the big alternations of ``dicts_to_pattern`` were matched against single tokens for.
+    A hashed lookup is much faster than trying hundreds of alternatives, and a token only matches if it's a whole word of the vocabulary
+    (``re.match`` would also have matched any word followed by a word boundary, as in ``"ST-5"``).
+
+    It has the same ``match`` as a compiled regex, except that it returns the matched token instead of a ``re.Match``, and it can be used as a parsing stage:
+        ``is_unit_type = TokenMatcher(unit_types_lst)``
+        ``unit_type = is_unit_type(inpt, save)``
+    """
+
+    __slots__ = ["words"]
+    words: FrozenSet[str]
+
+    def __init__(self, words: Iter[str]):
+        self.words = frozenset(w for w in words if w)
+
+    def __contains__(self, token: str) -> bool:
+        return token in self.words
+
+    def match(self, token: str) -> Opt[str]:
+        if token in self.words:
+            return token
+        return None
+
+    def __call__(self, inpt: In[str], save: Fn[[In[str]], None]) -> Opt[str]:
+        if inpt.empty():
+            return None
+        token = inpt.item()
+        if token in self.words:
+            save(inpt.rest())
+            return token
+        return None
+
+
+def dicts_to_matcher(*ds: Dict[str, List[Union[str, List[str]]]]) -> TokenMatcher:
+    "The same vocabulary as ``dicts_to_pattern``, as a ``TokenMatcher``"
+    f: List[str] = []
+    for d in ds:
+        for k, row in d.items():
+            f.extend(k.split())
+            for cell in row:
+                if isinstance(cell, str):
+                    cell = cell.split()
+                f.extend(cell)
+    return TokenMatcher(f)
+
+
+st_NESW_M = TokenMatcher(st_NESWs)
+unit_M = TokenMatcher(unit_types_lst)
+st_suffix_M = dicts_to_matcher(st_suffix_syns)
 
 
 def try_regex(pat: Pattern[str]) -> Fn[[In[str], Fn[[In[str]], None]], Opt[str]]:
+    match = pat.match
+
     def x(inpt: In[str], save: Fn[[In[str]], None]) -> Opt[str]:
         if inpt.empty():
             return None
-        item, rest = inpt.view()
-        m = re.match(pat, item)
+        m = match(inpt.item())
         if m is not None and m:
-            save(rest)
+            save(inpt.rest())
             return m.group(0)
         return None
 
@@ -82,21 +143,58 @@ def try_regex(pat: Pattern[str]) -> Fn[[In[str], Fn[[In[str]], None]], Opt[str]]
 
 
 def try_full_regex(pat: Pattern[str]) -> Fn[[In[str], Fn[[In[str]], None]], Opt[str]]:
+    fullmatch = pat.fullmatch
+
     def x(inpt: In[str], save: Fn[[In[str]], None]) -> Opt[str]:
         if inpt.empty():
             return None
-        item, rest = inpt.view()
-        m = re.fullmatch(pat, item)
+        m = fullmatch(inpt.item())
         if m is not None and m:
-            save(rest)
+            save(inpt.rest())
             return m.group(0)
         return None
 
     return x
 
 
+class TokenClass(NamedTuple):
+    """
+    What a single token looks like to the parsing stages (see ``classify``).
+    ``flags`` is a bitmask of the token classes below, and ``groups[i]`` is the text matched for the class ``1 << i`` (or ``None``)
+    """
+
+    flags: int
+    groups: Tuple[Opt[str], ...]
+
+
+# the token classes, in the order of ``TokenClass.groups``
+ZIP_CODE = 1 << 0
+HOUSE_NUMBER = 1 << 1
+LONELY_UNIT = 1 << 2
+NESW = 1 << 3
+ST_SUFFIX = 1 << 4
+UNIT_TYPE = 1 << 5
+STARTS_WITH_DIGIT = 1 << 6
+
+
+def try_class(flag: int) -> Fn[[In[str], Fn[[In[str]], None]], Opt[str]]:
+    "The same as ``try_regex``, but it tests the class of the token instead of matching a regex again"
+    idx = flag.bit_length() - 1
+
+    def x(inpt: In[str], save: Fn[[In[str]], None]) -> Opt[str]:
+        if inpt.empty():
+            return None
+        token_class = classify(inpt.item())
+        if token_class.flags & flag:
+            save(inpt.rest())
+            return token_class.groups[idx]
+        return None
+
+    return x
+
+
 # TODO don't match bad zips, like 948848-234
-zip_code = try_regex(zip_code_R)
+zip_code = try_class(ZIP_CODE)
 
 K = TypeVar("K")
 V = TypeVar("V")
@@ -114,72 +212,19 @@ class MxCont(Mx):
     pass
 
 
-def make_try_syns(
-    d: Dict[Tuple[Type[Mx], Seq[str]], str],
-    normalizers: List[Fn[[str], Iter[str]]] = [],
-) -> Fn[[Type[Mx], Seq[str]], Opt[Tuple[Seq[str], str]]]:
-    def x(mx: Type[Mx], items: Seq[str]) -> Opt[Tuple[Seq[str], str]]:
-        s = d.get((mx, items), None)
-        if s is not None:
-            return items, s
-        focus = items[-1]
-        _items = list(items)
-        for n in normalizers:
-            for maybe in n(focus):
-                _items[-1] = maybe
-                s = d.get((mx, tuple(_items)), None)
-                if s is not None:
-                    return _items, s
-        return None
-
-    return x
-
-
 def from_mealy(
     d: Dict[Tuple[Type[Mx], Seq[str]], str],
     normalizers: Seq[Opt[Dict[str, List[str]]]] = (),
-) -> Fn[[In[str], Fn[[In[str]], None]], Opt[str]]:
+) -> TokenTrie:
     """
     the list of values in each syndict in 'normalizers' is like OR
     the list of values in mealy d is like AND
-    """
-    # TODO make kwarg 'normalizers' have the type Seq[Union[Fn[[str], Iter[str]], Dict[str, Sequence[str]]]] = []
-    ns: List[Fn[[str], Iter[str]]] = []
-    for n in normalizers:
-        if isinstance(n, dict):
-            trans: Dict[str, List[str]] = {}
-            # n: Dict[str, Iter[str]] = n
-            for k, words in n.items():
-                if " " in k:
-                    raise Exception(f"'{k}' not allowed bc the syns can't have spaces")
-                for word in words:
-                    trans[word] = trans.get(word, [])
-                    trans[word].append(k)
-            ns.append(lambda s: trans.get(s, []))
-        else:
-            pass
-    try_syns = make_try_syns(d, ns)
-
-    def run(inpt: In[str], save: Fn[[In[str]], None]) -> Opt[str]:
-        l: List[str] = []
-        items: Seq[str] = ()
-        for s, rest in inpt.as_steps():
-            end_items_s = try_syns(MxEnd, (*items, s))
-            if end_items_s:
-                inpt = rest
-                _, s_end = end_items_s
-                l.append(s_end)
-            cont_items_s = try_syns(MxCont, (*items, s))
-            if cont_items_s is None:
-                break
-            else:
-                items, _ = cont_items_s
-        if not l:
-            return None
-        save(inpt)
-        return l[-1]
 
-    return run
+    The mealy dict is compiled into a ``TokenTrie`` (with the synonyms folded into its edges), which is called like any other parsing stage
+    """
+    syns = TokenTrie.merge_normalizers(n for n in normalizers if isinstance(n, dict))
+    rows = ((items, label) for (mx, items), label in d.items() if mx is MxEnd)
+    return TokenTrie.from_rows(rows, syns=syns)
 
 
 def to_mealy(
@@ -442,7 +487,7 @@ def get_with_label(
 
 
 def __get_secondary_unit_range__() -> Fn[[In[str], Fn[[In[str]], None]], Opt[str]]:
-    is_hwy_or_nesw = try_regex(dicts_to_pattern(hwys_syns, hwys, nesw_m, nesw_syns))
+    is_hwy_or_nesw = dicts_to_matcher(hwys_syns, hwys, nesw_m, nesw_syns)
 
     def x(inpt: In[str], save: Fn[[In[str]], None]) -> Opt[str]:
         if is_hwy_or_nesw(inpt, save):
@@ -471,12 +516,12 @@ get_st_suffix = get_with_label(
     ),
 )
 
-get_house_number = get_with_label("house_number", try_regex(_HOUSE_NUMBER_R))
+get_house_number = get_with_label("house_number", try_class(HOUSE_NUMBER))
 
-get_dangling_unit = try_regex(unit_R)  # "APT" with no identifer
+get_dangling_unit = try_class(UNIT_TYPE)  # "APT" with no identifer
 get_zip_code = get_with_label("zip_code", zip_code)
 
-is_hwy = dicts_to_pattern(hwys, hwys_syns)
+is_hwy = dicts_to_matcher(hwys, hwys_syns)
 
 
 def get_unit(inpt: In[str], save: Fn[[In[str]], None]) -> Opt[Tuple[str, str]]:
@@ -484,15 +529,17 @@ def get_unit(inpt: In[str], save: Fn[[In[str]], None]) -> Opt[Tuple[str, str]]:
     if single:
         return ("unit", single)
     # i.e, "3, APT" (because it's parsed from back to from at this point)
-    x, xs = inpt.item(), inpt.rest()
-    if re.match(st_suffix_R, x):
+    x = inpt.item()
+    flags = classify(x).flags
+    if flags & ST_SUFFIX:
         return None
-    if xs.empty():
+    if inpt.state + 1 >= inpt.end:
         return None
+    xs = inpt.rest()
     unit = get_unit_type(xs, save)
     if unit:
         return "unit", f"{unit} {x}"
-    if re.match(unit_R, x):
+    if flags & UNIT_TYPE:
         # TODO raise Exception("DANGLING UNIT")
         save(xs)
         pass
@@ -506,9 +553,9 @@ def get_full_hwy(inpt: In[str], save: Fn[[In[str]], None]) -> Opt[Tuple[str, str
     """
     if inpt.empty():
         return None
-    z, zs = inpt.item(), inpt.rest()
-    if not zs.empty():
-        y = get_hwy_name(zs, save)
+    z = inpt.item()
+    if inpt.state + 1 < inpt.end:
+        y = get_hwy_name(inpt.rest(), save)
         if y:
             return "st_name", f"{y[1]} {z}"
     return get_hwy_name(inpt, save)
@@ -531,28 +578,53 @@ def every_other(iter: Iter[T], item: T) -> Iter[T]:
     return join(zip(iter, always_item()))
 
 
-def city_mealy(known_cities: Seq[str] = ()) -> Dict[Tuple[Type[Mx], Seq[str]], str]:
-    d: Dict[str, List[Union[str, List[str]]]] = {}
-    for city in [*known_cities, *default_cities]:
-        d[city] = [city.upper().split()]
-    for _, city in state_city_pairs:
-        city = city.upper()
-        d[city] = [city.split()]
-    reverse_dict(d)
-    return to_mealy(d)
+def city_rows(cities: Iter[str]) -> Iter[Tuple[List[str], str]]:
+    """
+    The rows of a city trie. Tokens are reversed because the city is parsed from back to front.
+    The label is the tokens joined by single spaces, so spellings that only differ in whitespace (``__data__`` has both "JUDITH GAP" and "JUDITH  GAP") always get the same label
+    """
+    for city in cities:
+        tokens = city.upper().split()
+        label = " ".join(tokens)
+        tokens.reverse()
+        yield tokens, label
+
+
+def compile_base_city_trie() -> TokenTrie:
+    "Compiles the trie of all default U.S cities from ``__data__`` (which is slow to import)"
+    from .__data__ import state_city_pairs, default_cities
+
+    return TokenTrie.from_rows(
+        city_rows(join([default_cities, (city for _, city in state_city_pairs)])),
+        syns=syns,
+    )
+
+
+@lru_cache(maxsize=1)
+def base_city_trie() -> Union[TokenTrie, MappedTrie]:
+    """
+    The gazetteer of all default U.S cities. It's loaded once per process, the first time a ``Parser`` needs it.
+    If a gazetteer file exists (see ``__gazetteer__``) it's memory-mapped, otherwise the trie is compiled from ``__data__``.
+    It's shared by all parsers, so it must never be inserted into
+    """
+    from .__gazetteer__ import MappedTrie, GazetteerError, gazetteer_path
+
+    path = gazetteer_path()
+    if os.path.exists(path):
+        try:
+            return MappedTrie(path)
+        except GazetteerError as e:
+            warnings.warn(f"{e}, falling back to compiling the cities from __data__")
+    return compile_base_city_trie()
 
 
-get_city = get_with_label(
-    "city",
-    from_mealy(city_mealy(), normalizers=[syns]),
-)
 unit_id_atom = r"(\d+|\d+[A-Z]?|[A-Z]\d+|[A-D]|[F-M]|[O-R]|[T-V]|[X-Z])"
 dash = r"\-"
 lonely_unit_regex = re.compile(f"^#?{unit_id_atom}({dash}{unit_id_atom})?$")
 
-lonely_unit_id = try_regex(lonely_unit_regex)
+lonely_unit_id = try_class(LONELY_UNIT)
 
-get_nesw_single = get_with_label("st_NESW", try_full_regex(st_NESW_R))
+get_nesw_single = get_with_label("st_NESW", try_class(NESW))
 
 
 def space_join(stream: Iter[str]) -> str:
@@ -580,17 +652,74 @@ def get_city_til_tab(inpt: In[str], save: Fn[[In[str]], None]) -> Iter[str]:
 starts_with_digit = re.compile(r"^\d")
 
 
+def __matched_text__(match: Fn[[str], Opt[Match[str]]]) -> Fn[[str], Opt[str]]:
+    def x(token: str) -> Opt[str]:
+        m = match(token)
+        if m is None:
+            return None
+        return m.group(0)
+
+    return x
+
+
+# the matchers of the token classes, in the order of ``TokenClass.groups``.
+# Vocabularies are ``TokenMatcher``, and regexes are only kept for real patterns
+__token_matchers__: List[Fn[[str], Opt[str]]] = [
+    __matched_text__(zip_code_R.match),
+    __matched_text__(_HOUSE_NUMBER_R.match),
+    __matched_text__(lonely_unit_regex.match),
+    st_NESW_M.match,
+    st_suffix_M.match,
+    unit_M.match,
+    __matched_text__(starts_with_digit.match),
+]
+
+
+@lru_cache(maxsize=1 << 16)
+def classify(token: str) -> TokenClass:
+    """
+    Matches 'token' against each token-level regex of the parser at once, so that the parsing stages only test flags.
+    Since most tokens (suffixes, states, directions, street names ...) recur across addresses, most are only ever classified once
+    """
+    flags = 0
+    groups: List[Opt[str]] = []
+    for bit, match in enumerate(__token_matchers__):
+        group = match(token)
+        if group is not None:
+            flags |= 1 << bit
+        groups.append(group)
+    return TokenClass(flags, tuple(groups))
+
+
 def merge_rural_hwy(inpt: List[str]) -> List[str]:
     """Detects if an address has the form '123 W 2100 S, Tucson AZ'
     & merges 'W' and '2100' into a single token 'W-2100'
     """
-    if re.match(starts_with_digit, inpt[2]):
+    if classify(inpt[2]).flags & STARTS_WITH_DIGIT:
         # TODO match 'north west 2100' instead of only 'nw 2100'
-        if re.fullmatch(st_NESW_R, inpt[1]):
+        if classify(inpt[1]).flags & NESW:
             return [inpt[0], f"{inpt[1]} {inpt[2]}", *inpt[3:]]
     return inpt
 
 
+class ParseFailure(NamedTuple):
+    "An address string that couldn't be parsed by ``Parser.parse_many``, at position ``index`` of the input"
+    index: int
+    orig: str
+    reason: str
+
+    def as_error(self) -> ParseError:
+        return ParseError(self.orig, self.reason)
+
+
+__dots_and_commas__ = str.maketrans(".,", "  ")
+
+
+def tokenize(a: str) -> List[str]:
+    "The tokens that ``Parser.tag`` consumes, before ``merge_rural_hwy``"
+    return a.translate(__dots_and_commas__).upper().split()
+
+
 class FnsOfParser(Fns_Of):
     @staticmethod
     def get_city(inpt: In[str], save: Fn[[In[str]], None]) -> Opt[Tuple[str, str]]:
@@ -605,17 +734,40 @@ class Parser:
     ``p = Parser()``
     ``address: RawAddress = p("999 8th blvd California CA 54321")``
 
-    It comes pre-trained, and can recognize nearly all U.S cities. However, if there does happen to be a city it fails on, it can be passed to the ``known_cities`` argument of ``Parser.__init__``
+    It comes pre-trained, and can recognize nearly all U.S cities. However, if there does happen to be a city it fails on, it can be passed to the ``known_cities`` argument of ``Parser.__init__``,
+    or taught to a parser that's already in use with ``p.add_known_cities(["Qwertyville"])``
+
+    Feeds often list the same address many times. With a 'cache_size' (by default 0, which turns it off), the results of that many distinct addresses are remembered,
+    keyed on their tokens (so ``"1 Main St, Troy MI"`` and ``"1 MAIN ST TROY MI"`` share an entry). A cached address is returned with the caller's ``orig``,
+    and the hits and misses are in ``p.cache_info()``
     """
 
     __fns_of__: FnsOfParser
     known_cities: List[str]
-
-    def __init__(self, known_cities: Seq[str] = ()):
-        get_city = get_with_label(
-            "city",
-            from_mealy(city_mealy(known_cities=known_cities), normalizers=[syns]),
+    cache_size: int
+    hits: int
+    misses: int
+    __cache__: OrderedDict[str, Union[RawAddress, str]]
+    __cities__: LayeredTrie
+    __known__: Set[str]
+    __generation__: int
+
+    def __init__(self, known_cities: Seq[str] = (), cache_size: int = 0):
+        if cache_size < 0:
+            raise ValueError(f"cache_size must be at least 0, not {cache_size}")
+        self.cache_size = cache_size
+        self.hits = 0
+        self.misses = 0
+        self.__cache__ = OrderedDict()
+        # only the known cities are compiled here, the default cities are shared by all parsers
+        cities = LayeredTrie(
+            [base_city_trie(), TokenTrie.from_rows(city_rows(known_cities), syns=syns)]
         )
+        get_city = get_with_label("city", cities)
+        self.__cities__ = cities
+        self.__known__ = set(c.upper() for c in known_cities)
+        # bumped whenever cities are added, so that cached failures are forgotten
+        self.__generation__ = 0
 
         class __FnsOfParser__(FnsOfParser):
             @staticmethod
@@ -631,12 +783,39 @@ class Parser:
     def get_city(self) -> Fn[[In[str], Fn[[In[str]], None]], Opt[Tuple[str, str]]]:
         return self.__fns_of__.get_city
 
+    def copy(self) -> Parser:
+        "A new parser that knows the same cities (with an empty cache of the same size), so cities can be added to it without changing this one"
+        return Parser(known_cities=self.known_cities, cache_size=self.cache_size)
+
+    def add_known_cities(self, cities: Iter[str]) -> None:
+        """
+        Teaches the parser new cities, as if they had been passed to ``Parser.__init__``.
+        They are inserted into its trie of known cities in place, which costs O(tokens of the new cities), so a long-running parser can learn cities as it goes.
+        The cities it already knows are skipped. If anything was added, the cached addresses are forgotten (the hits and misses are kept, ``cache_clear`` resets them)
+        """
+        added: List[str] = []
+        for c in cities:
+            key = c.upper()
+            if key not in self.__known__:
+                self.__known__.add(key)
+                added.append(c)
+        if not added:
+            return None
+        for tokens, label in city_rows(added):
+            self.__cities__.insert(tokens, label)
+        self.known_cities.extend(added)
+        self.__generation__ += 1
+        # not ``cache_clear``, which would also reset the stats every time a ``Hammer`` takes in new addresses
+        self.__cache__.clear()
+
     def __tag__(
         self,
         get_inpt: Fn[[], In[str]],
         save: Fn[[In[str]], None],
+        tokens: List[str],
         city_done: bool = False,
     ) -> Iter[Opt[Tuple[str, str]]]:
+        "'tokens' are the tokens of the address in order, the input is the same tokens in reverse"
 
         if not city_done:
             yield get_zip_code(get_inpt(), save)
@@ -659,7 +838,8 @@ class Parser:
 
         ######################################
         ######################################
-        save(In(list(reversed(list(get_inpt())))))
+        # what's left (house number, street name ...) is parsed from front to back
+        save(get_inpt().flip(tokens))
         house_number: List[str] = []
         st_name: List[str] = []
         hn = get_house_number(get_inpt(), save)
@@ -705,19 +885,34 @@ class Parser:
         ``tags = [t for t in p.tag("777 Collins Southfield Maine")]``
         ``assert tags == [('orig', '777 Collins Southfield Maine'), ('us_state', 'ME'), ('city', 'SOUTHFIELD'), ('st_name', 'COLLINS'), ('house_number', '777')]``
         """
-        
-        add = re.sub(r"[.,]", " ", a).upper().split()
-        add = merge_rural_hwy(add)
-        add.reverse()
-        k = In(add)
-        f: List[In[str]] = [k]
+        return self.__tag_str__(a, *self.__scratch__())
+
+    @staticmethod
+    def __scratch__() -> Tuple[
+        List[In[str]], Fn[[In[str]], None], Fn[[], In[str]]
+    ]:
+        "The scratch input of the tagger, and the functions to set and get it"
+        f: List[In[str]] = [In([])]
 
         def save(d: Any, f: List[In[str]] = f):
             f[0] = d
 
         get_inpt = lambda: f[0]
+        return f, save, get_inpt
+
+    def __tag_str__(
+        self,
+        a: str,
+        f: List[In[str]],
+        save: Fn[[In[str]], None],
+        get_inpt: Fn[[], In[str]],
+        tokens: Opt[List[str]] = None,
+    ) -> Iter[Tuple[str, str]]:
+        "``Parser.tag`` with its scratch input 'f' (and the functions to get and set it) passed in, so they can be reused"
+        add = merge_rural_hwy(tokenize(a) if tokens is None else tokens)
+        f[0] = In(add[::-1])
         yield "orig", a
-        for pair in self.__tag__(get_inpt, save):
+        for pair in self.__tag__(get_inpt, save, add):
             if pair:
                 pair = (pair[0], pair[1].strip())
                 if pair[1]:
@@ -725,15 +920,23 @@ class Parser:
 
     @staticmethod
     def __collect__(d: Dict[str, str]) -> RawAddress:
+        # the components that repeat across addresses are interned, so that all addresses share a few string objects (which also makes comparing them cheaper)
+        get = d.get
+        st_suffix, st_NESW, unit, zip_code = (
+            get("st_suffix"),
+            get("st_NESW"),
+            get("unit"),
+            get("zip_code"),
+        )
         return RawAddress(
             house_number=d["house_number"],
-            st_name=d["st_name"],
-            st_suffix=d.get("st_suffix", None),
-            st_NESW=d.get("st_NESW", None),
-            unit=d.get("unit", None),
-            city=d["city"],
-            us_state=d["us_state"],
-            zip_code=d.get("zip_code", None),
+            st_name=intern(d["st_name"]),
+            st_suffix=None if st_suffix is None else intern(st_suffix),
+            st_NESW=None if st_NESW is None else intern(st_NESW),
+            unit=None if unit is None else intern(unit),
+            city=intern(d["city"]),
+            us_state=intern(d["us_state"]),
+            zip_code=None if zip_code is None else intern(zip_code),
             orig=d["orig"],
             batch_checksum="",
         )
@@ -761,9 +964,8 @@ class Parser:
         yield "city", normalize_whitespace(row.pop().upper())
         data = list(join(map(lambda s: s.upper().split(), row)))
         data = merge_rural_hwy(data)
-        data.reverse()
-        r = [In(data)]
-        for pair in self.__tag__(lambda: r[0], make_mod(r), city_done=True):
+        r = [In(data[::-1])]
+        for pair in self.__tag__(lambda: r[0], make_mod(r), data, city_done=True):
             if pair:
                 pair = (pair[0], pair[1].strip())
                 if pair[1]:
@@ -774,12 +976,110 @@ class Parser:
         Directionals such as ``"South"`` and ``"Nth west"`` will all be normalized to the abbreviated form (except when part of a city name, as in ``"South Haven"``). This is the USPS standardized way to write states, such as ``"N Carolina"``
         """
 
+        r = self.__parse_str__(s, *self.__scratch__())
+        if isinstance(r, str):
+            raise ParseError(s, r)
+        return r
+
+    def cache_info(self) -> CacheInfo:
+        return CacheInfo(self.hits, self.misses, self.cache_size, len(self.__cache__))
+
+    def cache_clear(self) -> None:
+        "Forgets the cached addresses and resets the stats"
+        self.__cache__.clear()
+        self.hits = 0
+        self.misses = 0
+
+    def __parse_str__(
+        self,
+        a: str,
+        f: List[In[str]],
+        save: Fn[[In[str]], None],
+        get_inpt: Fn[[], In[str]],
+    ) -> Union[RawAddress, str]:
+        "Parses 'a' (going through the cache), returning the reason in place of the address if it can't be parsed"
+        if not self.cache_size:
+            return self.__try_parse__(a, f, save, get_inpt)
+        tokens = tokenize(a)
+        key = " ".join(tokens)
+        cache = self.__cache__
+        r = cache.get(key)
+        if r is None:
+            self.misses += 1
+            r = self.__try_parse__(a, f, save, get_inpt, tokens)
+            cache[key] = r
+            if len(cache) > self.cache_size:
+                cache.popitem(last=False)
+            return r
+        self.hits += 1
+        cache.move_to_end(key)
+        if isinstance(r, str) or r.orig == a:
+            return r
+        return r._replace(orig=a)
+
+    def __try_parse__(
+        self,
+        a: str,
+        f: List[In[str]],
+        save: Fn[[In[str]], None],
+        get_inpt: Fn[[], In[str]],
+        tokens: Opt[List[str]] = None,
+    ) -> Union[RawAddress, str]:
         try:
-            return self.__collect__(dict(self.tag(s)))
+            tags = self.__tag_str__(a, f, save, get_inpt, tokens)
+            return self.__collect__(dict(tags))
         except KeyError as ke:
-            raise ParseError(s, ke.args[0])
+            return ke.args[0]
         except EndOfInputError:
-            raise ParseError(s, "End of input")
+            return "End of input"
+
+    def parse_many(
+        self, adds: Iter[str], errors: str = "collect", cache_size: int = 4096
+    ) -> Iter[Union[RawAddress, ParseFailure]]:
+        """
+        Parses each address string of 'adds' like ``Parser.__call__``, streaming the results in order. What happens to the strings that can't be parsed depends on 'errors':
+            * ``"collect"`` yields a ``ParseFailure`` in their place
+            * ``"skip"`` drops them
+            * ``"raise"`` raises their ``ParseError``
+
+        The parser's scratch input is set up once for the whole batch, and the results of the last 'cache_size' distinct strings are remembered (0 turns it off),
+        so repeated strings in a batch are only parsed once:
+
+            ``for a in p.parse_many(address_strings): ...``
+        """
+        if errors not in ("collect", "skip", "raise"):
+            raise ValueError(
+                f"errors must be 'collect', 'skip' or 'raise', not {repr(errors)}"
+            )
+        if cache_size < 0:
+            raise ValueError(f"cache_size must be at least 0, not {cache_size}")
+
+        f, save, get_inpt = self.__scratch__()
+        parse_str = self.__parse_str__
+        # the reason is cached in place of an address that can't be parsed
+        cache: OrderedDict[str, Union[RawAddress, str]] = OrderedDict()
+        generation = self.__generation__
+        for idx, a in enumerate(adds):
+            if generation != self.__generation__:
+                # cities were added while streaming, so the cached failures may parse now
+                cache.clear()
+                generation = self.__generation__
+            r = cache.get(a)
+            if r is None:
+                r = parse_str(a, f, save, get_inpt)
+                if cache_size:
+                    cache[a] = r
+                    if len(cache) > cache_size:
+                        cache.popitem(last=False)
+            else:
+                cache.move_to_end(a)
+            if isinstance(r, str):
+                if errors == "raise":
+                    raise ParseError(a, r)
+                if errors == "collect":
+                    yield ParseFailure(idx, a, r)
+            else:
+                yield r
 
     def __parse_row__(self, a: Seq[str]) -> RawAddress:
         """
@@ -799,33 +1099,232 @@ def smart_batch(
     p: Parser,
     adds: Iter[str],
     report_error: Fn[[ParseError, str], None] = lambda e, s: None,
+    add_cities: bool = False,
 ) -> Iter[RawAddress]:
     """
     This function takes an iter of address strings and tries to repair dirty addresses by using the city information from clean ones.
     For example: "123 Main, Springfield OH 12123" will be correctly parsed iff 'SPRINGFIELD' is a city of another address.
     The 'report_error' callback is called on all address strings that cannot be repaired
     (other than 'report_error', all ParseErrors are ignored)
+
+    The repairs are parsed by a copy of 'p' that knows the cities of the batch, so 'p' is left as it was.
+    With 'add_cities', the cities are added to 'p' itself instead (with ``Parser.add_known_cities``), so it keeps knowing them afterwards
     """
     errs: List[str] = []
     cities: Set[str] = set([])
-    pre = 0
+    for a in p.parse_many(adds):
+        if isinstance(a, ParseFailure):
+            errs.append(a.orig)
+        else:
+            cities.add(a.city)
+            yield a
+    if not add_cities:
+        if not errs:
+            return None
+        p = p.copy()
+    p.add_known_cities(sorted(cities))
+    for a in p.parse_many(errs):
+        if isinstance(a, ParseFailure):
+            report_error(a.as_error(), a.orig)
+        else:
+            yield a
+
+
+class __Spill__:
+    """
+    The address strings that are waiting to be retried by ``stream_batch``.
+    At most 'max_in_memory' are kept in memory, the rest are appended to a temporary file (one json string per line) that is deleted on ``close``.
+    """
+
+    max_in_memory: int
+    spill_dir: Opt[str]
+    in_memory: List[str]
+    n_spilled: int
+    __tmp__: Opt[Any]
+
+    def __init__(self, max_in_memory: int, spill_dir: Opt[str] = None):
+        self.max_in_memory = max_in_memory
+        self.spill_dir = spill_dir
+        self.in_memory = []
+        self.n_spilled = 0
+        self.__tmp__ = None
+
+    def append(self, s: str) -> None:
+        if len(self.in_memory) < self.max_in_memory:
+            self.in_memory.append(s)
+            return None
+        if self.__tmp__ is None:
+            self.__tmp__ = tempfile.TemporaryFile(
+                "w+", encoding="utf-8", dir=self.spill_dir
+            )
+        self.__tmp__.write(json.dumps(s) + "\n")
+        self.n_spilled += 1
+
+    def drain(self) -> Iter[str]:
+        "Yields (and forgets) all the strings, the spilled ones are read back one line at a time"
+        in_memory, self.in_memory = self.in_memory, []
+        yield from in_memory
+        f, self.__tmp__ = self.__tmp__, None
+        if f is not None:
+            try:
+                f.seek(0)
+                for line in f:
+                    yield json.loads(line)
+            finally:
+                f.close()
+        self.n_spilled = 0
+
+    def close(self) -> None:
+        if self.__tmp__ is not None:
+            self.__tmp__.close()
+            self.__tmp__ = None
+
+    def __len__(self) -> int:
+        return len(self.in_memory) + self.n_spilled
+
+
+def stream_batch(
+    p: Parser,
+    adds: Iter[str],
+    report_error: Fn[[ParseError, str], None] = lambda e, s: None,
+    window: int = 1000,
+    max_pending: int = 100000,
+    spill_dir: Opt[str] = None,
+    add_cities: bool = False,
+) -> Iter[RawAddress]:
+    """
+    The same as ``smart_batch``, but for inputs too big to hold every failure in memory.
+
+    Failures are collected in a window of (at most) 'window' strings. When the window is full it's retried with the cities learned so far,
+    which are added with ``Parser.add_known_cities`` (instead of building a new ``Parser`` each time) to a copy of 'p', or to 'p' itself with 'add_cities'.
+    The strings that still fail are kept for a last retry at the end of the input: the first 'max_pending' in memory, and the rest in a temporary file in 'spill_dir'.
+    'report_error' is called on the strings that fail the last retry.
+
+    The addresses are yielded as soon as they are parsed, so they aren't in the order of 'adds'.
+    """
+    if window < 1:
+        raise ValueError(f"window must be at least 1, not {window}")
+    if max_pending < 0:
+        raise ValueError(f"max_pending must be at least 0, not {max_pending}")
+    if not add_cities:
+        p = p.copy()
+    cities: Set[str] = set(c.upper() for c in p.known_cities)
+    learned: List[str] = []
+    failed: List[str] = []
+    pending = __Spill__(max_pending, spill_dir)
+
+    def learn(a: RawAddress) -> RawAddress:
+        if a.city not in cities:
+            cities.add(a.city)
+            learned.append(a.city)
+        return a
+
+    def retry(strings: Iter[str]) -> Iter[Union[RawAddress, ParseFailure]]:
+        p.add_known_cities(learned)
+        learned.clear()
+        return p.parse_many(strings)
+
+    try:
+        for a in p.parse_many(adds):
+            if isinstance(a, ParseFailure):
+                failed.append(a.orig)
+                if len(failed) < window:
+                    continue
+                if learned:
+                    for b in retry(failed):
+                        if isinstance(b, ParseFailure):
+                            pending.append(b.orig)
+                        else:
+                            yield learn(b)
+                else:
+                    for s in failed:
+                        pending.append(s)
+                failed.clear()
+            else:
+                yield learn(a)
+
+        for a in retry(join([failed, pending.drain()])):
+            if isinstance(a, ParseFailure):
+                report_error(a.as_error(), a.orig)
+            else:
+                yield learn(a)
+    finally:
+        pending.close()
+
+
+@lru_cache(maxsize=4)
+def __worker_parser__(known_cities: Tuple[str, ...]) -> Parser:
+    "Each worker process builds its own ``Parser`` once per set of known cities"
+    return Parser(known_cities=known_cities)
+
+
+def __parse_shard__(
+    known_cities: Tuple[str, ...], shard: List[str]
+) -> List[Union[RawAddress, Tuple[str, str]]]:
+    """
+    Parses a shard of address strings in a worker process.
+    Failures are returned as ``(orig, reason)`` because a ``ParseError`` can't be pickled
+    """
+    p = __worker_parser__(known_cities)
+    return [
+        (a.orig, a.reason) if isinstance(a, ParseFailure) else a
+        for a in p.parse_many(shard)
+    ]
+
+
+def __shards__(adds: Iter[str], size: int) -> Iter[List[str]]:
+    shard: List[str] = []
     for add in adds:
-        try:
-            a = p(add)
+        shard.append(add)
+        if len(shard) == size:
+            yield shard
+            shard = []
+    if shard:
+        yield shard
+
+
+def parallel_batch(
+    p: Parser,
+    adds: Iter[str],
+    report_error: Fn[[ParseError, str], None] = lambda e, s: None,
+    workers: int = 2,
+    executor: Opt[Executor] = None,
+    shard_size: int = 2000,
+) -> Iter[RawAddress]:
+    """
+    The same as ``smart_batch``, but both parsing passes are sharded across a process pool (each worker holds its own ``Parser``).
+    The output, and the order of calls to 'report_error', are identical to ``smart_batch``.
+    If 'executor' is given it's used (and not shut down), otherwise a ``ProcessPoolExecutor`` with 'workers' processes is made for the batch.
+    """
+    if executor is None:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            yield from parallel_batch(
+                p, adds, report_error, executor=pool, shard_size=shard_size
+            )
+        return None
+
+    def run(
+        known_cities: Seq[str], adds: Iter[str]
+    ) -> Iter[Union[RawAddress, Tuple[str, str]]]:
+        cities = tuple(known_cities)
+        shards = list(__shards__(adds, shard_size))
+        return join(executor.map(__parse_shard__, [cities] * len(shards), shards))
+
+    errs: List[str] = []
+    cities: Set[str] = set([])
+    for a in run(p.known_cities, adds):
+        if isinstance(a, RawAddress):
             cities.add(a.city)
-            pre += 1
             yield a
-        except ParseError:
-            errs.append(add)
-    p = Parser(known_cities=p.known_cities + list(cities))
-    fixed = 0
-    for add in errs:
-        try:
-            a = p(add)
-            fixed += 1
+        else:
+            errs.append(a[0])
+    # sorted, so that every worker builds the same trie in the same order
+    for a in run([*p.known_cities, *sorted(cities)], errs):
+        if isinstance(a, RawAddress):
             yield a
-        except ParseError as e:
-            report_error(e, add)
+        else:
+            orig, reason = a
+            report_error(ParseError(orig, reason), orig)
 
 
 __difficult_addresses__ = [
@@ -0,0 +1,298 @@
+"""
+An asyncio front-end that micro-batches concurrent lookups, for serving address normalization behind a web service.
+
+Each request is queued, and the queued requests are run together (up to 'max_batch' of them, waiting at most 'max_wait' seconds for more)
+with ``Parser.parse_many`` and the batched lookups of a ``Hammer``, in a worker pool so the event loop stays responsive:
+
+    ``service = Service(hammer)``
+    ``async with service:``
+    ``    a = await service.lookup("123 Main St Springfield OH")``
+
+``LocalClient`` runs a service on its own event loop in a background thread, which is handy for tests and for synchronous callers:
+
+    ``with LocalClient(Service(hammer)) as client:``
+    ``    a = client.lookup("123 Main St Springfield OH")``
+"""
+from __future__ import annotations
+import asyncio
+import threading
+import time
+from collections import deque
+from concurrent.futures import Executor, ThreadPoolExecutor
+from typing import Deque
+from .__types__ import Any, List, NamedTuple, Opt, Seq, Union
+from .__address__ import Address, RawAddress
+from .__parsing__ import Parser, ParseFailure
+from .__hammer__ import Hammer
+
+PARSE = "parse"
+LOOKUP = "lookup"
+
+
+class ServiceMetrics(NamedTuple):
+    "The stats of a ``Service`` since it started. The latencies (in milliseconds, from queueing a request to its result) are of the last 'latency_window' requests"
+    requests: int
+    errors: int
+    batches: int
+    mean_batch_size: float
+    throughput: float  # requests per second
+    latency_mean_ms: float
+    latency_p50_ms: float
+    latency_p99_ms: float
+    latency_max_ms: float
+
+
+class __Request__(NamedTuple):
+    kind: str
+    s: str
+    future: "asyncio.Future[Any]"
+    queued_at: float
+
+
+def percentile(xs: Seq[float], q: float) -> float:
+    "The 'q' percentile (0-100) of the sorted 'xs' (nearest rank)"
+    if not xs:
+        return 0.0
+    idx = min(len(xs) - 1, max(0, int(round(q / 100 * len(xs))) - 1))
+    return xs[idx]
+
+
+class Service:
+    """
+    Serves ``parse`` (with the parser of 'target', which is a ``Parser`` or a ``Hammer``) and ``lookup`` (``hammer[s]``, only if 'target' is a ``Hammer``) to many concurrent callers.
+
+    The requests are run in batches of at most 'max_batch', and a batch waits at most 'max_wait' seconds for more requests once its first one arrives.
+    While a batch runs, the next one fills up, so the batches grow with the load.
+    The batches run one at a time in 'executor' (by default a single worker thread of its own), because parsers and hammers are not thread safe.
+    """
+
+    target: Union[Parser, Hammer]
+    max_batch: int
+    max_wait: float
+    latency_window: int
+    __executor__: Executor
+    __owns_executor__: bool
+    __queue__: Opt["asyncio.Queue[Opt[__Request__]]"]
+    __task__: Opt["asyncio.Task[None]"]
+    __latencies__: Deque[float]
+    __requests__: int
+    __errors__: int
+    __batches__: int
+    __started_at__: float
+
+    def __init__(
+        self,
+        target: Union[Parser, Hammer],
+        max_batch: int = 256,
+        max_wait: float = 0.002,
+        executor: Opt[Executor] = None,
+        latency_window: int = 10000,
+    ):
+        if max_batch < 1:
+            raise ValueError(f"max_batch must be at least 1, not {max_batch}")
+        if max_wait < 0:
+            raise ValueError(f"max_wait must be at least 0, not {max_wait}")
+        self.target = target
+        self.max_batch = max_batch
+        self.max_wait = max_wait
+        self.latency_window = latency_window
+        self.__owns_executor__ = executor is None
+        self.__executor__ = (
+            ThreadPoolExecutor(max_workers=1) if executor is None else executor
+        )
+        self.__queue__ = None
+        self.__task__ = None
+        self.__latencies__ = deque(maxlen=latency_window)
+        self.__requests__ = 0
+        self.__errors__ = 0
+        self.__batches__ = 0
+        self.__started_at__ = time.perf_counter()
+
+    @property
+    def parser(self) -> Parser:
+        return self.target.p if isinstance(self.target, Hammer) else self.target
+
+    async def start(self) -> None:
+        "Starts batching (on the running event loop)"
+        if self.__task__ is not None:
+            raise RuntimeError("the service was already started")
+        self.__queue__ = asyncio.Queue()
+        self.__started_at__ = time.perf_counter()
+        self.__task__ = asyncio.get_running_loop().create_task(self.__batcher__())
+
+    async def close(self) -> None:
+        "Finishes the requests that were already queued, and stops"
+        if self.__queue__ is None or self.__task__ is None:
+            return None
+        queue, task = self.__queue__, self.__task__
+        self.__queue__ = None
+        await queue.put(None)
+        await task
+        self.__task__ = None
+        if self.__owns_executor__:
+            self.__executor__.shutdown(wait=True)
+
+    async def __aenter__(self) -> Service:
+        await self.start()
+        return self
+
+    async def __aexit__(self, *exc: Any) -> None:
+        await self.close()
+
+    async def parse(self, s: str) -> RawAddress:
+        "``parser(s)``, possibly raising a ``ParseError``"
+        return await self.__submit__(PARSE, s)
+
+    async def lookup(self, s: str) -> Address:
+        "``hammer[s]``, possibly raising a ``ParseError`` or a ``KeyError``"
+        if not isinstance(self.target, Hammer):
+            raise TypeError("lookups need a Service of a Hammer, not of a Parser")
+        return await self.__submit__(LOOKUP, s)
+
+    async def __submit__(self, kind: str, s: str) -> Any:
+        if self.__queue__ is None:
+            raise RuntimeError("the service isn't running")
+        future: "asyncio.Future[Any]" = asyncio.get_running_loop().create_future()
+        await self.__queue__.put(__Request__(kind, s, future, time.perf_counter()))
+        return await future
+
+    def metrics(self) -> ServiceMetrics:
+        latencies = sorted(self.__latencies__)
+        elapsed = time.perf_counter() - self.__started_at__
+        ms = lambda x: x * 1000
+        return ServiceMetrics(
+            requests=self.__requests__,
+            errors=self.__errors__,
+            batches=self.__batches__,
+            mean_batch_size=self.__requests__ / self.__batches__
+            if self.__batches__
+            else 0.0,
+            throughput=self.__requests__ / elapsed if elapsed > 0 else 0.0,
+            latency_mean_ms=ms(sum(latencies) / len(latencies)) if latencies else 0.0,
+            latency_p50_ms=ms(percentile(latencies, 50)),
+            latency_p99_ms=ms(percentile(latencies, 99)),
+            latency_max_ms=ms(latencies[-1]) if latencies else 0.0,
+        )
+
+    async def __batcher__(self) -> None:
+        queue = self.__queue__
+        assert queue is not None
+        loop = asyncio.get_running_loop()
+        closing = False
+        while not closing:
+            first = await queue.get()
+            if first is None:
+                break
+            batch = [first]
+            deadline = loop.time() + self.max_wait
+            while len(batch) < self.max_batch:
+                if queue.empty():
+                    timeout = deadline - loop.time()
+                    if timeout <= 0:
+                        break
+                    try:
+                        r = await asyncio.wait_for(queue.get(), timeout)
+                    except asyncio.TimeoutError:
+                        break
+                else:
+                    r = queue.get_nowait()
+                if r is None:
+                    closing = True
+                    break
+                batch.append(r)
+            await self.__run__(loop, batch)
+
+    async def __run__(
+        self, loop: asyncio.AbstractEventLoop, batch: List[__Request__]
+    ) -> None:
+        for kind in (PARSE, LOOKUP):
+            requests = [r for r in batch if r.kind == kind]
+            if not requests:
+                continue
+            strings = [r.s for r in requests]
+            try:
+                results = await loop.run_in_executor(
+                    self.__executor__, self.__work__, kind, strings
+                )
+            except Exception as e:
+                results = [e for _ in requests]
+            done = time.perf_counter()
+            self.__batches__ += 1
+            self.__requests__ += len(requests)
+            for r, result in zip(requests, results):
+                self.__latencies__.append(done - r.queued_at)
+                if r.future.done():  # the caller gave up
+                    continue
+                if isinstance(result, Exception):
+                    self.__errors__ += 1
+                    r.future.set_exception(result)
+                else:
+                    r.future.set_result(result)
+
+    def __work__(self, kind: str, strings: List[str]) -> List[Any]:
+        "Runs a batch in the worker pool"
+        if kind == LOOKUP:
+            assert isinstance(self.target, Hammer)
+            return self.target.__get_many__(strings)
+        return [
+            a.as_error() if isinstance(a, ParseFailure) else a
+            for a in self.parser.parse_many(strings)
+        ]
+
+
+class LocalClient:
+    """
+    A synchronous, in-process client of a ``Service``, which it runs on its own event loop in a background thread.
+    ``parse_many`` and ``lookup_many`` send all their requests at once, so they are batched together like concurrent requests would be
+    """
+
+    service: Service
+    __loop__: asyncio.AbstractEventLoop
+    __thread__: threading.Thread
+
+    def __init__(self, service: Service):
+        self.service = service
+        self.__loop__ = asyncio.new_event_loop()
+        self.__thread__ = threading.Thread(target=self.__loop__.run_forever, daemon=True)
+        self.__thread__.start()
+        self.__wait__(service.start())
+
+    def __wait__(self, coro: Any) -> Any:
+        return asyncio.run_coroutine_threadsafe(coro, self.__loop__).result()
+
+    def parse(self, s: str) -> RawAddress:
+        return self.__wait__(self.service.parse(s))
+
+    def lookup(self, s: str) -> Address:
+        return self.__wait__(self.service.lookup(s))
+
+    def parse_many(self, ss: Seq[str]) -> List[Union[RawAddress, Exception]]:
+        "The result of each ``parse``, or the exception it raised"
+        return self.__wait__(self.__gather__(PARSE, ss))
+
+    def lookup_many(self, ss: Seq[str]) -> List[Union[Address, Exception]]:
+        "The result of each ``lookup``, or the exception it raised"
+        return self.__wait__(self.__gather__(LOOKUP, ss))
+
+    async def __gather__(self, kind: str, ss: Seq[str]) -> List[Any]:
+        f = self.service.parse if kind == PARSE else self.service.lookup
+        return await asyncio.gather(*(f(s) for s in ss), return_exceptions=True)
+
+    def metrics(self) -> ServiceMetrics:
+        return self.service.metrics()
+
+    def close(self) -> None:
+        if not self.__thread__.is_alive():
+            return None
+        try:
+            self.__wait__(self.service.close())
+        finally:
+            self.__loop__.call_soon_threadsafe(self.__loop__.stop)
+            self.__thread__.join()
+            self.__loop__.close()
+
+    def __enter__(self) -> LocalClient:
+        return self
+
+    def __exit__(self, *exc: Any) -> None:
+        self.close()
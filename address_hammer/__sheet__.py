@@ -4,6 +4,7 @@ from .__types__ import Union, Tuple, Seq, Iter, List, NamedTuple, Dict, Fn, Opt
 from .__hammer__ import Hammer
 from .__address__ import RawAddress, Address
 from .__parsing__ import Parser, ParseError
+from .__checksum__ import MD5
 
 idx_of: Dict[str, int] = dict(
     [(char, idx) for (idx, char) in enumerate(ascii_uppercase)]
@@ -54,6 +55,7 @@ class Sheet:
         junk_cities: Seq[str] = (),
         junk_streets: Seq[str] = (),
         make_batch_checksum: bool = True,
+        checksum_mode: str = MD5,
     ):
         """See ``class`` docs. Takes all optional args for a ``Hammer``"""
 
@@ -85,6 +87,7 @@ class Sheet:
             junk_cities=junk_cities,
             junk_streets=junk_streets,
             make_batch_checksum=make_batch_checksum,
+            checksum_mode=checksum_mode,
         )
 
         self.right_len = max(*map(len, map(lambda row: row.right, self.rows)))
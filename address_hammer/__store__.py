@@ -0,0 +1,363 @@
+"""
+A compact, columnar set of addresses.
+
+A set of ``Address`` namedtuples costs a tuple, and often a string of its own, for every field of every address.
+An ``AddressStore`` keeps each field in a column of uint32 codes into a table of distinct strings (so a city or a street name is stored once),
+the ``orig`` strings in a plain list (or not at all with ``keep_orig=False``), and only builds ``Address`` objects when they are read:
+
+    ``store = AddressStore(addresses, keep_orig=False)``
+    ``assert addresses[0] in store``
+    ``for a in store: ...``
+    ``adds = store.to_list()  # faster than list(store)``
+
+Like a ``set`` of addresses, two addresses are the same address iff all of their components are the same (``orig`` and ``batch_checksum`` are ignored, and the first one added is kept).
+
+``store.table()`` exports the addresses in bulk, as dictionary-encoded columns (see ``ColumnTable``), and ``store.positions(addresses)`` maps addresses to their rows in it:
+
+    ``table = store.table()``
+    ``df = pandas.DataFrame(table.to_dict())``
+    ``rows = store.positions(addresses)  # -1 where an address isn't in the store``
+"""
+from __future__ import annotations
+import gc
+import struct
+from array import array
+from functools import partial
+from itertools import repeat
+from .__types__ import Any, Dict, Iter, List, NamedTuple, Opt, Tuple
+from .__address__ import Address, RawAddress
+
+try:
+    import numpy as np
+except ImportError:  # numpy is optional, without it the exported columns are ``array`` instead
+    np = None
+
+# the fields with a column of codes, in the order of ``Address``
+CODED_FIELDS: Tuple[str, ...] = tuple(f for f in Address._fields if f != "orig")
+# the components that identify an address
+KEY_FIELDS: Tuple[str, ...] = tuple(f for f in CODED_FIELDS if f != "batch_checksum")
+NONE = 0
+
+__key__ = struct.Struct(f"<{len(KEY_FIELDS)}I")
+__orig_idx__ = Address._fields.index("orig")
+__key_idxs__ = [Address._fields.index(f) for f in KEY_FIELDS]
+__coded_idxs__ = [Address._fields.index(f) for f in CODED_FIELDS]
+# where the key components are in ``CODED_FIELDS``
+__key_columns__ = [CODED_FIELDS.index(f) for f in KEY_FIELDS]
+# ``Address._make`` without checking the length (the rows of the columns always have every field)
+__new_address__ = partial(tuple.__new__, Address)
+
+
+class ColumnTable(NamedTuple):
+    """
+    Addresses as columns, each dictionary-encoded like an Arrow ``DictionaryArray``: the 'field' of the address at 'row' is ``strings[codes[field][row]]``
+    (code ``0`` is ``None``), and its ``orig`` is ``origs[row]`` (``""`` if the store doesn't keep them).
+    The codes are uint32 numpy arrays (or ``array("I")`` without numpy), so the columns can be joined and grouped without building any ``Address``:
+
+        ``pandas.Categorical.from_codes(table.codes["city"], table.strings)``
+    """
+
+    strings: List[Opt[str]]
+    codes: Dict[str, Any]
+    origs: List[str]
+
+    @property
+    def n_rows(self) -> int:
+        return len(self.origs)
+
+    def column(self, field: str) -> List[Opt[str]]:
+        "The decoded values of 'field' (one of ``Address._fields``)"
+        if field == "orig":
+            return self.origs
+        return list(map(self.strings.__getitem__, self.codes[field]))
+
+    def to_dict(self) -> Dict[str, List[Opt[str]]]:
+        "Each field of ``Address`` and its decoded column, which is what ``pandas.DataFrame`` takes"
+        return {field: self.column(field) for field in Address._fields}
+
+    def to_records(self) -> Any:
+        "The rows as a numpy structured array with a (python object) field for each field of ``Address``"
+        if np is None:
+            raise ImportError("ColumnTable.to_records needs numpy")
+        records = np.empty(self.n_rows, dtype=[(field, object) for field in Address._fields])
+        strings = np.array(self.strings, dtype=object)
+        for field in Address._fields:
+            if field == "orig":
+                records[field] = self.origs
+            else:
+                records[field] = strings[np.asarray(self.codes[field], dtype=np.intp)]
+        return records
+
+    def address(self, row: int) -> Address:
+        return Address._make(
+            self.origs[row] if field == "orig" else self.strings[self.codes[field][row]]
+            for field in Address._fields
+        )
+
+
+class AddressStore:
+    """
+    A set of addresses stored as columns. Besides being iterable, it supports ``len``, ``in``, ``add``, ``discard``, ``update`` and ``difference_update`` like a set.
+    The rows of discarded addresses are reused by the next ones that are added.
+    """
+
+    __slots__ = ["keep_orig", "strings", "code_of", "columns", "origs", "rows", "free"]
+    keep_orig: bool
+    strings: List[Opt[str]]
+    code_of: Dict[Opt[str], int]
+    columns: List[array]
+    origs: Opt[List[str]]
+    rows: Dict[bytes, int]
+    free: List[int]
+
+    def __init__(self, addresses: Iter[Address] = (), keep_orig: bool = True):
+        self.keep_orig = keep_orig
+        self.strings = [None]
+        self.code_of = {None: NONE}
+        self.columns = [array("I") for _ in CODED_FIELDS]
+        self.origs = [] if keep_orig else None
+        self.rows = {}
+        self.free = []
+        self.update(addresses)
+
+    def __intern__(self, s: Opt[str]) -> int:
+        code = self.code_of.get(s)
+        if code is None:
+            code = len(self.strings)
+            self.strings.append(s)
+            self.code_of[s] = code
+        return code
+
+    def __key_of__(self, a: Address) -> Opt[bytes]:
+        "The key of 'a', or None if one of its components isn't in the string table (so it can't be in the store)"
+        code_of = self.code_of
+        codes: List[int] = []
+        for idx in __key_idxs__:
+            code = code_of.get(a[idx])
+            if code is None:
+                return None
+            codes.append(code)
+        return __key__.pack(*codes)
+
+    def add(self, a: Address) -> None:
+        intern = self.__intern__
+        codes = [intern(a[idx]) for idx in __coded_idxs__]
+        key = __key__.pack(*[codes[idx] for idx in __key_columns__])
+        if key in self.rows:
+            return None
+        if self.free:
+            row = self.free.pop()
+            for column, c in zip(self.columns, codes):
+                column[row] = c
+            if self.origs is not None:
+                self.origs[row] = a.orig
+        else:
+            row = len(self.columns[0])
+            for column, c in zip(self.columns, codes):
+                column.append(c)
+            if self.origs is not None:
+                self.origs.append(a.orig)
+        self.rows[key] = row
+
+    def update(self, addresses: Iter[Address]) -> None:
+        for a in addresses:
+            self.add(a)
+
+    def discard(self, a: Address) -> None:
+        key = self.__key_of__(a)
+        if key is None:
+            return None
+        row = self.rows.pop(key, None)
+        if row is None:
+            return None
+        self.free.append(row)
+        if self.origs is not None:
+            self.origs[row] = ""
+
+    def difference_update(self, addresses: Iter[Address]) -> None:
+        for a in addresses:
+            self.discard(a)
+
+    def __contains__(self, a: object) -> bool:
+        if not isinstance(a, Address):
+            return False
+        key = self.__key_of__(a)
+        return key is not None and key in self.rows
+
+    def __len__(self) -> int:
+        return len(self.rows)
+
+    def address(self, row: int) -> Address:
+        "Builds the address of 'row'. Its ``orig`` is ``\"\"`` if the store doesn't keep them"
+        strings = self.strings
+        values: List[Any] = [strings[column[row]] for column in self.columns]
+        values.insert(__orig_idx__, "" if self.origs is None else self.origs[row])
+        return Address._make(values)
+
+    def __decoded__(self) -> List[Iter[Any]]:
+        "The decoded values of the live rows, a column for each field of ``Address``"
+        get = self.strings.__getitem__
+        if self.free:
+            live = sorted(self.rows.values())
+            cols: List[Iter[Any]] = [
+                map(get, [column[row] for row in live]) for column in self.columns
+            ]
+            origs: Iter[str] = (
+                repeat("") if self.origs is None else [self.origs[row] for row in live]
+            )
+        else:
+            cols = [map(get, column) for column in self.columns]
+            origs = repeat("") if self.origs is None else self.origs
+        cols.insert(__orig_idx__, origs)
+        return cols
+
+    def __iter__(self) -> Iter[Address]:
+        # each column is decoded on its own, which is much faster than building the addresses one row at a time
+        return map(__new_address__, zip(*self.__decoded__()))
+
+    def to_list(self) -> List[Address]:
+        """
+        ``list(store)``, but 2-3x faster: unlike a set, the store builds an ``Address`` for each row that is read,
+        and building them all at once with the cyclic gc paused stops the new tuples from setting it off over and over
+        """
+        gc_was_enabled = gc.isenabled()
+        gc.disable()
+        try:
+            return list(map(__new_address__, zip(*self.__decoded__())))
+        finally:
+            if gc_was_enabled:
+                gc.enable()
+
+    def table(self) -> ColumnTable:
+        "The addresses as a ``ColumnTable``, with the rows in the order of iteration. It is a copy, so it doesn't change with the store"
+        live = sorted(self.rows.values()) if self.free else None
+        codes: Dict[str, Any] = {}
+        for field, column in zip(CODED_FIELDS, self.columns):
+            if np is not None:
+                c = np.frombuffer(column, dtype=np.uint32)
+                codes[field] = c.copy() if live is None else c[live]
+            else:
+                codes[field] = array("I", column if live is None else (column[row] for row in live))
+        n = len(self.columns[0]) if live is None else len(live)
+        if self.origs is None:
+            origs = [""] * n
+        else:
+            origs = list(self.origs) if live is None else [self.origs[row] for row in live]
+        return ColumnTable(list(self.strings), codes, origs)
+
+    def positions(self, addresses: Iter[Opt[Address]]) -> Any:
+        """
+        The row in ``table()`` of each address (or -1 if it's ``None`` or isn't in the store),
+        as an int64 numpy array (or ``array("q")`` without numpy)
+        """
+        rows = self.rows
+        key_of = self.__key_of__
+        found: List[int] = []
+        for a in addresses:
+            key = None if a is None else key_of(a)
+            found.append(-1 if key is None else rows.get(key, -1))
+        if self.free:
+            # the table skips the free rows
+            rank = {row: pos for pos, row in enumerate(sorted(rows.values()))}
+            found = [rank.get(row, -1) for row in found]
+        if np is not None:
+            return np.array(found, dtype=np.int64)
+        return array("q", found)
+
+    def snapshot(self) -> Dict[str, Any]:
+        "Plain data (the string table and the live rows of each column) that ``AddressStore.from_snapshot`` reads back"
+        live = sorted(self.rows.values())
+        columns = self.columns
+        return {
+            "keep_orig": self.keep_orig,
+            "strings": self.strings,
+            "columns": [array("I", (c[row] for row in live)) for c in columns],
+            "origs": None if self.origs is None else [self.origs[row] for row in live],
+        }
+
+    @staticmethod
+    def from_snapshot(d: Dict[str, Any]) -> AddressStore:
+        store: AddressStore = AddressStore.__new__(AddressStore)
+        store.keep_orig = d["keep_orig"]
+        store.strings = d["strings"]
+        store.code_of = {s: code for code, s in enumerate(store.strings)}
+        store.columns = d["columns"]
+        store.origs = d["origs"]
+        store.free = []
+        key_columns = [store.columns[idx] for idx in __key_columns__]
+        store.rows = {
+            __key__.pack(*codes): row for row, codes in enumerate(zip(*key_columns))
+        }
+        return store
+
+
+class AddressList:
+    """
+    A list of addresses as columns of codes, the same way as ``AddressStore``, but in order, with the duplicates, and remembering which are a ``RawAddress``.
+    ``HashableFactory.snapshot`` writes the addresses of its groups with it, and its string table is shared with whatever else is interned into it
+    """
+
+    __slots__ = ["strings", "code_of", "columns", "raw", "origs"]
+    strings: List[Opt[str]]
+    code_of: Dict[Opt[str], int]
+    columns: List[array]
+    raw: array
+    origs: Opt[List[str]]
+
+    def __init__(self, addresses: Iter[Address] = (), keep_orig: bool = True):
+        self.strings = [None]
+        self.code_of = {None: NONE}
+        self.columns = [array("I") for _ in CODED_FIELDS]
+        self.raw = array("B")
+        self.origs = [] if keep_orig else None
+        self.extend(addresses)
+
+    def intern(self, s: Opt[str]) -> int:
+        code = self.code_of.get(s)
+        if code is None:
+            code = len(self.strings)
+            self.strings.append(s)
+            self.code_of[s] = code
+        return code
+
+    def extend(self, addresses: Iter[Address]) -> None:
+        intern = self.intern
+        columns = list(zip(self.columns, __coded_idxs__))
+        for a in addresses:
+            for column, idx in columns:
+                column.append(intern(a[idx]))
+            self.raw.append(a.__class__ is RawAddress)
+            if self.origs is not None:
+                self.origs.append(a.orig)
+
+    def __len__(self) -> int:
+        return len(self.raw)
+
+    def __iter__(self) -> Iter[Address]:
+        get = self.strings.__getitem__
+        cols: List[Iter[Any]] = [map(get, column) for column in self.columns]
+        cols.insert(__orig_idx__, repeat("") if self.origs is None else self.origs)
+        make_raw, make = RawAddress._make, Address._make
+        return (
+            make_raw(values) if raw else make(values)
+            for raw, values in zip(self.raw, zip(*cols))
+        )
+
+    def snapshot(self) -> Dict[str, Any]:
+        "Plain data (the string table, the columns and which rows are a ``RawAddress``) that ``AddressList.from_snapshot`` reads back"
+        return {
+            "strings": self.strings,
+            "columns": self.columns,
+            "raw": self.raw,
+            "origs": self.origs,
+        }
+
+    @staticmethod
+    def from_snapshot(d: Dict[str, Any]) -> AddressList:
+        adds: AddressList = AddressList.__new__(AddressList)
+        adds.strings = d["strings"]
+        adds.code_of = {s: code for code, s in enumerate(adds.strings)}
+        adds.columns = d["columns"]
+        adds.raw = d["raw"]
+        adds.origs = d["origs"]
+        return adds
@@ -0,0 +1,200 @@
+from __future__ import annotations
+from typing import TYPE_CHECKING
+from .__types__ import Dict, List, Set, Tuple, Seq, Iter, Opt, Fn, Union
+from .__zipper__ import GenericInput as In
+
+if TYPE_CHECKING:
+    from .__gazetteer__ import MappedTrie
+
+
+class TokenTrie:
+    """
+    A compiled matcher over sequences of tokens (words).
+
+    States are integers: ``edges[state]`` maps a token to the next state and ``labels[state]`` is the label emitted when a match may end there (or ``None``).
+    State ``0`` is the root. A ``TokenTrie`` is called like the other parsing stages, and is what ``from_mealy`` compiles to:
+
+        ``trie = TokenTrie.from_rows([(["EAST", "NORTH"], "NE")], syns={"NORTH": ["N"]})``
+        ``label = trie(inpt, save)``
+
+    ``syns`` maps a canonical token to its synonyms. They are folded into the edges when a token is inserted, so matching never retries normalizers.
+    A folded edge is an alias of the canonical edge. If a later ``insert`` goes through an alias, the synonym gets its own state, which keeps
+    the label and the edges of the canonical state until it has a label or edges of its own (so inserting ``"N X"`` never makes ``"NORTH X"`` match).
+    """
+
+    __slots__ = [
+        "edges",
+        "labels",
+        "syns",
+        "__aliases__",
+        "__base_of__",
+        "__heirs__",
+        "__inherited__",
+    ]
+    edges: List[Dict[str, int]]
+    labels: List[Opt[str]]
+    syns: Dict[str, List[str]]
+    __aliases__: Set[Tuple[int, str]]
+    __base_of__: Dict[int, int]
+    __heirs__: Dict[int, List[int]]
+    __inherited__: Set[int]
+
+    def __init__(self, syns: Dict[str, List[str]] = {}):
+        self.edges = [{}]
+        self.labels = [None]
+        self.syns = {k: list(v) for k, v in syns.items()}
+        self.__aliases__ = set([])
+        self.__base_of__ = {}
+        self.__heirs__ = {}
+        self.__inherited__ = set([])
+
+    def __new_state__(self, edges: Dict[str, int], label: Opt[str]) -> int:
+        self.edges.append(edges)
+        self.labels.append(label)
+        return len(self.labels) - 1
+
+    def __own_edges__(self, state: int) -> Dict[str, int]:
+        e = self.edges[state]
+        base = self.__base_of__.get(state)
+        if base is not None and e is self.edges[base]:
+            # the synonym now continues on its own, so it stops sharing the canonical edges
+            e = {}
+            self.edges[state] = e
+        return e
+
+    def __child__(self, state: int, token: str) -> int:
+        "The state after ``token``, creating (or un-aliasing) it if needed"
+        e = self.__own_edges__(state)
+        nxt = e.get(token)
+        if nxt is None:
+            nxt = self.__new_state__({}, None)
+            e[token] = nxt
+            for syn in self.syns.get(token, ()):
+                if syn not in e:
+                    e[syn] = nxt
+                    self.__aliases__.add((state, syn))
+        elif (state, token) in self.__aliases__:
+            base = nxt
+            nxt = self.__new_state__(self.edges[base], self.labels[base])
+            self.__base_of__[nxt] = base
+            self.__heirs__[base] = self.__heirs__.get(base, [])
+            self.__heirs__[base].append(nxt)
+            self.__inherited__.add(nxt)
+            self.__aliases__.discard((state, token))
+            e[token] = nxt
+        return nxt
+
+    def __set_label__(self, state: int, label: str) -> None:
+        self.labels[state] = label
+        for heir in self.__heirs__.get(state, ()):
+            if heir in self.__inherited__:
+                self.__set_label__(heir, label)
+
+    def insert(self, tokens: Seq[str], label: str) -> None:
+        "Adds a row, which costs O(len(tokens))"
+        state = 0
+        for token in tokens:
+            state = self.__child__(state, token)
+        self.__inherited__.discard(state)
+        self.__set_label__(state, label)
+
+    def longest_match(
+        self, data: Seq[str], start: int = 0, end: Opt[int] = None
+    ) -> Tuple[Opt[str], int]:
+        """
+        Walks ``data`` from ``start`` (up to ``end``) and returns the label of the longest match and the index just past it.
+        If nothing matched, the label is ``None`` and the index is ``start``
+        """
+        edges, labels = self.edges, self.labels
+        state = 0
+        label: Opt[str] = None
+        match_end = start
+        for idx in range(start, len(data) if end is None else end):
+            state = edges[state].get(data[idx], -1)
+            if state < 0:
+                break
+            l = labels[state]
+            if l is not None:
+                label, match_end = l, idx + 1
+        return label, match_end
+
+    def __call__(self, inpt: In[str], save: Fn[[In[str]], None]) -> Opt[str]:
+        label, match_end = self.longest_match(inpt.data, inpt.state, inpt.end)
+        if label is None:
+            return None
+        save(inpt.advance(match_end - inpt.state))
+        return label
+
+    def __len__(self) -> int:
+        return len(self.labels)
+
+    @staticmethod
+    def merge_normalizers(
+        normalizers: Iter[Dict[str, List[str]]]
+    ) -> Dict[str, List[str]]:
+        """
+        The normalizers of ``from_mealy`` map a canonical token to its synonyms (which are like 'OR').
+        This merges them into a single ``syns`` dict, dropping tokens that are their own synonym
+        """
+        syns: Dict[str, List[str]] = {}
+        for n in normalizers:
+            for k, words in n.items():
+                if " " in k:
+                    raise Exception(f"'{k}' not allowed bc the syns can't have spaces")
+                for word in words:
+                    if word != k:
+                        syns[k] = syns.get(k, [])
+                        syns[k].append(word)
+        return syns
+
+    @staticmethod
+    def from_rows(
+        rows: Iter[Tuple[Seq[str], str]], syns: Dict[str, List[str]] = {}
+    ) -> TokenTrie:
+        trie = TokenTrie(syns=syns)
+        for tokens, label in rows:
+            trie.insert(tokens, label)
+        return trie
+
+
+class LayeredTrie:
+    """
+    Several ``TokenTrie`` that are matched as if they were one (the longest match wins, and earlier layers win ties).
+
+    This lets a big, shared trie (like the gazetteer of all U.S cities) be extended without copying it:
+        ``cities = LayeredTrie([base_city_trie(), TokenTrie.from_rows(city_rows(known_cities), syns=syns)])``
+
+    ``insert`` only ever writes to the last layer.
+    """
+
+    __slots__ = ["layers"]
+    layers: List[Union[TokenTrie, MappedTrie]]
+
+    def __init__(self, layers: Seq[Union[TokenTrie, MappedTrie]]):
+        if not layers:
+            raise ValueError("a LayeredTrie needs at least one layer")
+        self.layers = list(layers)
+
+    def insert(self, tokens: Seq[str], label: str) -> None:
+        top = self.layers[-1]
+        if not isinstance(top, TokenTrie):
+            raise TypeError("the last layer of a LayeredTrie must be a TokenTrie")
+        top.insert(tokens, label)
+
+    def longest_match(
+        self, data: Seq[str], start: int = 0, end: Opt[int] = None
+    ) -> Tuple[Opt[str], int]:
+        label: Opt[str] = None
+        match_end = start
+        for layer in self.layers:
+            l, e = layer.longest_match(data, start, end)
+            if l is not None and e > match_end:
+                label, match_end = l, e
+        return label, match_end
+
+    def __call__(self, inpt: In[str], save: Fn[[In[str]], None]) -> Opt[str]:
+        label, match_end = self.longest_match(inpt.data, inpt.state, inpt.end)
+        if label is None:
+            return None
+        save(inpt.advance(match_end - inpt.state))
+        return label
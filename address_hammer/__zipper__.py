@@ -1,6 +1,6 @@
 from __future__ import annotations
 from typing import Generic
-from .__types__ import Iter, Seq, T, List, Tuple
+from .__types__ import Iter, Seq, T, List, Tuple, Opt
 
 
 class EndOfInputError(Exception):
@@ -14,16 +14,24 @@ class EndOfInputError(Exception):
 
 
 class GenericInput(Generic[T]):
-    __slots__ = ["state", "data"]
+    """
+    A cursor over a shared buffer of tokens: ``data[state:end]`` is what's left to parse.
+    A cursor is never mutated, and stepping only makes a new cursor with other offsets (``data`` is never copied).
+    So a parsing stage can hold on to a cursor and backtrack for free, and failing stages don't allocate at all
+    """
+
+    __slots__ = ["state", "data", "end"]
     state: int
     data: Seq[T]
+    end: int
 
-    def __init__(self, data: Seq[T], state: int = 0):
-        self.data = list(data)
+    def __init__(self, data: Seq[T], state: int = 0, end: Opt[int] = None):
+        self.data = data
         self.state = state
+        self.end = len(data) if end is None else end
 
     def copy(self) -> GenericInput[T]:
-        return GenericInput(self.data, self.state)
+        return GenericInput(self.data, self.state, self.end)
 
     def __iter__(self) -> InputIter[T]:
         return InputIter(self)
@@ -32,11 +40,11 @@ class GenericInput(Generic[T]):
         return InputIter(self)
 
     def as_list(self) -> List[T]:
-        return [x for x in self.as_iter()]
+        return list(self.data[self.state : self.end])
 
     def item(self) -> T:
         # print(self.as_str())
-        if self.state + 1 > len(self.data):
+        if self.state >= self.end:
             raise EndOfInputError()  # (self.as_str(), "getting item")
         return self.data[self.state]
 
@@ -44,37 +52,39 @@ class GenericInput(Generic[T]):
         return " ".join(map(str, self.data))
 
     def as_str(self) -> str:
-        idx = len(self.data) - self.state
-        return " ".join(map(str, self.data[-idx:]))
+        return " ".join(map(str, self.data[self.state : self.end]))
 
     def advance(self, step: int) -> GenericInput[T]:
         new_state = self.state + step
 
-        if new_state > len(self.data):
+        if new_state > self.end:
             raise EndOfInputError()
 
-        g: GenericInput[T] = GenericInput(state=new_state, data=self.data)
-        return g
+        return GenericInput(self.data, new_state, self.end)
 
     def rest_as_str(self) -> str:
-        idx = len(self.data) - self.state - 1
-        return " ".join(map(str, self.data[-idx:]))
+        return " ".join(map(str, self.data[self.state + 1 : self.end]))
 
     def rest(self) -> GenericInput[T]:
-        return GenericInput(self.data, self.state + 1)
+        return GenericInput(self.data, self.state + 1, self.end)
 
     def view(self) -> Tuple[T, GenericInput[T]]:
         return (self.item(), self.rest())
 
+    def flip(self, reversed_data: Seq[T]) -> GenericInput[T]:
+        "The rest of the input in the opposite order, given 'reversed_data' (which must be ``data`` reversed)"
+        n = len(self.data)
+        return GenericInput(reversed_data, n - self.end, n - self.state)
+
     @staticmethod
     def from_str(s: str) -> GenericInput[str]:
         return GenericInput(s.upper().split())
 
     def empty(self) -> bool:
-        return self.state + 1 > len(self.data)
+        return self.state >= self.end
 
     def __len__(self) -> int:
-        return len(self.data) - self.state + 1
+        return self.end - self.state + 1
 
     def as_steps(self) -> Iter[Tuple[T, GenericInput[T]]]:
         s = self
@@ -84,19 +94,22 @@ class GenericInput(Generic[T]):
 
 
 class InputIter(Generic[T]):
-    __slots__ = ["i"]
-    i: GenericInput[T]
+    __slots__ = ["data", "idx", "end"]
+    data: Seq[T]
+    idx: int
+    end: int
 
     def __init__(self, i: GenericInput[T]):
-        self.i = i
+        self.data = i.data
+        self.idx = i.state
+        self.end = i.end
 
     def __iter__(self) -> InputIter[T]:
-        return InputIter(self.i)
+        return self
 
     def __next__(self) -> T:
-        try:
-            item = self.i.item()
-        except EndOfInputError:
+        idx = self.idx
+        if idx >= self.end:
             raise StopIteration
-        self.i = self.i.rest()
-        return item
\ No newline at end of file
+        self.idx = idx + 1
+        return self.data[idx]